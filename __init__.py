@@ -5,9 +5,19 @@ kktools自定义节点集合
 
 import os
 import sys
+import json
+import copy
+import time
+import types
+import threading
 import importlib.util
 import traceback
 
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
 # 添加当前目录到Python路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
@@ -16,6 +26,117 @@ if current_dir not in sys.path:
 # nodes 文件夹路径
 nodes_dir = os.path.join(current_dir, "nodes")
 
+# 懒加载模式：KKTOOLS_LAZY_LOAD=1 时根据缓存清单注册节点，首次执行节点时才导入对应模块
+LAZY_LOAD = os.environ.get("KKTOOLS_LAZY_LOAD", "0").strip().lower() in ("1", "true", "yes", "on")
+
+# 节点清单缓存文件（按文件 mtime/size 失效）：KKTOOLS_MANIFEST=<路径> > KKTOOLS_STATE_DIR 目录 > 包目录
+# 包目录只读（例如预构建的容器镜像）时，可在构建镜像时生成清单，或指向可写位置
+MANIFEST_PATH = os.environ.get("KKTOOLS_MANIFEST", "").strip()
+if not MANIFEST_PATH:
+    MANIFEST_PATH = os.path.join(os.environ.get("KKTOOLS_STATE_DIR", "").strip() or current_dir, ".kktools_manifest.json")
+MANIFEST_VERSION = 2
+
+# 写入清单的节点类属性（元组类型的属性在读取时还原为元组）
+MANIFEST_ATTRS = ("RETURN_TYPES", "RETURN_NAMES", "FUNCTION", "CATEGORY", "OUTPUT_NODE",
+                  "OUTPUT_IS_LIST", "INPUT_IS_LIST", "DESCRIPTION")
+MANIFEST_TUPLE_ATTRS = ("RETURN_TYPES", "RETURN_NAMES", "OUTPUT_IS_LIST")
+
+# 节点模块可以定义 MANIFEST_DEPENDENCIES（路径列表），这些路径的 mtime 变化时清单中的 INPUT_TYPES 失效
+# （例如 image.py 的字体目录决定 ImageFrame 的字体选项列表）
+MANIFEST_DEPENDENCIES_ATTR = "MANIFEST_DEPENDENCIES"
+
+# 调用过字体刷新接口后，声明了依赖路径的代理类不再使用清单中的 INPUT_TYPES（文件原地替换时目录 mtime 不变）
+DEPENDENCIES_REFRESHED = False
+
+# 需要转发到真实节点类的类方法（存在时才生成）
+LAZY_CLASSMETHODS = ("IS_CHANGED", "VALIDATE_INPUTS")
+
+# 导入耗时报告：KKTOOLS_IMPORT_REPORT=<路径> 写入指定文件，=1 写入包目录下的默认文件
+IMPORT_REPORT_PATH = os.environ.get("KKTOOLS_IMPORT_REPORT", "").strip()
+if IMPORT_REPORT_PATH.lower() in ("1", "true", "yes", "on"):
+    IMPORT_REPORT_PATH = os.path.join(current_dir, "kktools_import_report.json")
+elif IMPORT_REPORT_PATH.lower() in ("0", "false", "no", "off"):
+    IMPORT_REPORT_PATH = ""
+
+# 每个模块的导入记录（耗时、峰值内存增量、引入的第三方包）
+IMPORT_REPORT = []
+
+# 已完成导入的节点模块（导入过程中模块已在 sys.modules 里，但尚未执行完）
+LOADED_MODULES = {}
+
+def get_peak_rss_kb():
+    """获取当前进程的峰值常驻内存（KB），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 返回字节，Linux 返回 KB
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def get_local_module_names():
+    """获取 nodes 目录下的本地模块名（不计入第三方包）"""
+    if not os.path.isdir(nodes_dir):
+        return set()
+    return {os.path.splitext(f)[0] for f in os.listdir(nodes_dir)}
+
+# 本地模块名在发现节点之前计算一次
+LOCAL_MODULE_NAMES = get_local_module_names()
+
+# 第三方包的安装目录名
+SITE_PACKAGES_DIRS = ("site-packages", "dist-packages")
+
+def is_site_package(module):
+    """模块是否有位于 site-packages 中的真实文件（排除 cython_runtime 等没有文件的伪模块）"""
+    file_path = getattr(module, "__file__", None)
+    if not isinstance(file_path, str):
+        return False
+    parts = os.path.normpath(os.path.abspath(file_path)).split(os.sep)
+    return any(part in SITE_PACKAGES_DIRS for part in parts)
+
+def get_third_party_packages(module_names):
+    """从模块名集合中筛选出第三方顶层包名"""
+    stdlib_names = getattr(sys, "stdlib_module_names", frozenset(sys.builtin_module_names))
+    packages = set()
+    for name in module_names:
+        top_name = name.split('.')[0]
+        if (top_name in packages or top_name.startswith('_') or top_name in stdlib_names or
+                top_name in LOCAL_MODULE_NAMES or top_name == __name__.split('.')[0]):
+            continue
+        if is_site_package(sys.modules.get(top_name)):
+            packages.add(top_name)
+    return sorted(packages)
+
+def get_referenced_packages(module):
+    """获取模块全局命名空间直接引用的第三方包（与导入顺序无关）"""
+    referenced = set()
+    for value in vars(module).values():
+        if isinstance(value, types.ModuleType):
+            referenced.add(value.__name__)
+        else:
+            owner = getattr(value, "__module__", None)
+            if isinstance(owner, str):
+                referenced.add(owner)
+    return get_third_party_packages(referenced)
+
+def write_import_report():
+    """将导入记录写入 JSON 报告（仅在启用 KKTOOLS_IMPORT_REPORT 时）"""
+    if not IMPORT_REPORT_PATH:
+        return
+    report = {
+        "version": 1,
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "lazy_load": LAZY_LOAD,
+        "total_import_time_ms": round(sum(r["import_time_ms"] for r in IMPORT_REPORT), 3),
+        "modules": IMPORT_REPORT,
+    }
+    tmp_path = f"{IMPORT_REPORT_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, IMPORT_REPORT_PATH)
+    except Exception as e:
+        print(f"⚠️  写入导入耗时报告失败: {e}")
+
 def load_module_from_file(module_name, file_path):
     """从文件路径加载模块"""
     try:
@@ -30,14 +151,243 @@ def load_module_from_file(module_name, file_path):
             
         module = importlib.util.module_from_spec(spec)
         sys.modules[module_name] = module
-        spec.loader.exec_module(module)
-        print(f"   ✅ {module_name} 加载成功")
+        
+        # 记录导入前的状态
+        modules_before = set(sys.modules)
+        rss_before = get_peak_rss_kb()
+        start_time = time.perf_counter()
+        import_ok = False
+        try:
+            spec.loader.exec_module(module)
+            import_ok = True
+        finally:
+            import_time_ms = (time.perf_counter() - start_time) * 1000.0
+            rss_after = get_peak_rss_kb()
+            IMPORT_REPORT.append({
+                "module": module_name,
+                "file": os.path.basename(file_path),
+                "ok": import_ok,
+                "import_time_ms": round(import_time_ms, 3),
+                "peak_rss_delta_kb": rss_after - rss_before if rss_before is not None else None,
+                "new_packages": get_third_party_packages(set(sys.modules) - modules_before),
+                "packages": get_referenced_packages(module),
+            })
+        LOADED_MODULES[module_name] = module
+        print(f"   ✅ {module_name} 加载成功 ({import_time_ms:.1f} ms)")
         return module
     except Exception as e:
         print(f"   ❌ 加载 {module_name} 失败: {e}")
         print(f"   详细错误: {traceback.format_exc()}")
         return None
 
+def is_node_class(attr):
+    """检查是否是有效的节点类"""
+    return (isinstance(attr, type) and
+            hasattr(attr, 'INPUT_TYPES') and
+            hasattr(attr, 'RETURN_TYPES') and
+            hasattr(attr, 'FUNCTION') and
+            hasattr(attr, 'CATEGORY'))
+
+def get_display_name(attr_name):
+    """根据节点类名生成显示名称"""
+    display_name = attr_name
+    if attr_name.startswith('kktools'):
+        display_name = f"kktools {attr_name[7:]}"
+    
+    # 添加中文描述
+    chinese_desc = ""
+    if 'Size' in attr_name:
+        chinese_desc = " (尺寸)"
+    elif 'BatchImageSaver' in attr_name:
+        chinese_desc = " (批量图像保存)"
+    elif 'Batch' in attr_name:
+        chinese_desc = " (批量提示词)"
+    elif 'Prompt' in attr_name:
+        chinese_desc = " (AI提示词生成)"
+    elif 'String' in attr_name:
+        if 'Merge' in attr_name:
+            chinese_desc = " (字符串合并)"
+        elif 'Input' in attr_name:
+            chinese_desc = " (字符串/整数输入)"
+        elif 'Replace' in attr_name:
+            chinese_desc = " (字符串替换)"
+        elif 'Advanced' in attr_name:
+            chinese_desc = " (字符串裁剪-高级)"
+        else:
+            chinese_desc = " (字符串裁剪)"
+    elif 'Regex' in attr_name:
+        if 'Advanced' in attr_name:
+            chinese_desc = " (正则表达式-高级)"
+        else:
+            chinese_desc = " (正则表达式)"
+    elif 'PadImage' in attr_name:
+        chinese_desc = " (图像填充到画布)"
+    elif 'ImageFrame' in attr_name:
+        chinese_desc = " (图像边框)"
+    elif 'Resize_img_and_mask' in attr_name:
+        chinese_desc = " (图像蒙版同步调整)"
+    elif 'GetImage' in attr_name:
+        chinese_desc = " (获取图像尺寸)"
+    elif 'Resize' in attr_name:
+        chinese_desc = " (图像蒙版同步调整)"
+    elif 'AIPromptOptimizer' in attr_name:
+        chinese_desc = " (AI提示词优化)"
+    # 新增的节点名称映射
+    elif attr_name == 'InputNode':
+        chinese_desc = " (多类型输入)"
+    elif attr_name == 'ReplaceNode':
+        chinese_desc = " (字符串替换)"
+    elif attr_name == 'SomethingToAny':
+        chinese_desc = " (任意类型转换)"
+    elif attr_name == 'MathExpressionNode':
+        chinese_desc = " (数学表达式)"
+    
+    return f"{display_name}{chinese_desc}"
+
+def get_file_stamp(file_path):
+    """获取文件的 mtime/size 标记，用于判断清单是否失效"""
+    stat = os.stat(file_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def get_dependency_stamps(paths):
+    """获取依赖路径的 mtime（不存在时为 None），用于判断清单中的动态选项是否过期"""
+    stamps = []
+    for path in paths:
+        try:
+            stamps.append([path, os.stat(path).st_mtime_ns])
+        except OSError:
+            stamps.append([path, None])
+    return stamps
+
+def dependencies_changed(dependency_stamps):
+    """依赖路径的 mtime 是否与清单记录的不同（或已手动刷新）"""
+    if not dependency_stamps:
+        return False
+    return DEPENDENCIES_REFRESHED or get_dependency_stamps([path for path, _ in dependency_stamps]) != dependency_stamps
+
+def read_manifest():
+    """读取节点清单缓存，版本不匹配或损坏时返回空清单"""
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+        return data.get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+def write_manifest(files):
+    """原子写入节点清单缓存"""
+    tmp_path = f"{MANIFEST_PATH}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(MANIFEST_PATH)), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION, "files": files}, f, ensure_ascii=False)
+        os.replace(tmp_path, MANIFEST_PATH)
+    except Exception as e:
+        print(f"⚠️  写入节点清单失败: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def describe_node_class(node_class):
+    """提取节点类的静态描述（INPUT_TYPES、RETURN_TYPES、CATEGORY 等），无法序列化时返回 None"""
+    try:
+        info = {"INPUT_TYPES": node_class.INPUT_TYPES()}
+        for attr_name in MANIFEST_ATTRS:
+            if hasattr(node_class, attr_name):
+                value = getattr(node_class, attr_name)
+                info[attr_name] = list(value) if isinstance(value, tuple) else value
+        info["classmethods"] = [name for name in LAZY_CLASSMETHODS if hasattr(node_class, name)]
+        # 确认可以写入 JSON
+        json.dumps(info, ensure_ascii=False)
+        return info
+    except Exception as e:
+        print(f"      ⚠️  无法缓存节点描述 {node_class.__name__}: {e}")
+        return None
+
+def restore_input_types(input_types):
+    """将清单中的输入定义还原为 ComfyUI 使用的 (类型, 选项) 元组"""
+    restored = {}
+    for section, inputs in input_types.items():
+        if isinstance(inputs, dict):
+            restored[section] = {name: tuple(spec) if isinstance(spec, list) else spec
+                                 for name, spec in inputs.items()}
+        else:
+            restored[section] = inputs
+    return restored
+
+# 懒加载导入锁：服务器线程（INPUT_TYPES）和执行线程可能同时首次访问同一个代理类，
+# 不加锁时同一个节点文件会被导入两次，得到两份类对象和模块级缓存/线程池
+IMPORT_LOCK = threading.Lock()
+
+def get_loaded_module(module_name, file_path):
+    """获取已从 file_path 完成导入的模块，未导入（或正在导入）时返回 None"""
+    module = LOADED_MODULES.get(module_name)
+    if module is not None and getattr(module, "__file__", None) == file_path:
+        return module
+    return None
+
+def import_node_module(module_name, file_path):
+    """导入（或复用已导入的）节点模块"""
+    module = get_loaded_module(module_name, file_path)
+    if module is not None:
+        return module
+    with IMPORT_LOCK:
+        # 等待锁期间其他线程可能已完成导入
+        module = get_loaded_module(module_name, file_path)
+        if module is not None:
+            return module
+        module = load_module_from_file(module_name, file_path)
+        write_import_report()
+    if module is None:
+        raise ImportError(f"无法加载 kktools 模块: {module_name}")
+    return module
+
+def make_lazy_node_class(module_name, file_path, class_name, info, dependency_stamps=None):
+    """根据清单生成代理节点类，首次执行时才导入真实模块"""
+    input_types = restore_input_types(info["INPUT_TYPES"])
+    
+    def real_class():
+        return getattr(import_node_module(module_name, file_path), class_name)
+    
+    def is_loaded():
+        return get_loaded_module(module_name, file_path) is not None
+    
+    def INPUT_TYPES(cls):
+        # 模块已加载或依赖路径（例如字体目录）已变化时使用真实定义（动态字体列表），否则使用缓存
+        if is_loaded() or dependencies_changed(dependency_stamps):
+            return real_class().INPUT_TYPES()
+        return copy.deepcopy(input_types)
+    
+    def __getattr__(self, name):
+        # 只有代理类上不存在的属性才会进入这里（例如 FUNCTION 指向的方法）
+        if name.startswith('__'):
+            raise AttributeError(name)
+        instance = self.__dict__.get('_kktools_instance')
+        if instance is None:
+            instance = real_class()()
+            self.__dict__['_kktools_instance'] = instance
+        return getattr(instance, name)
+    
+    attrs = {
+        "INPUT_TYPES": classmethod(INPUT_TYPES),
+        "__getattr__": __getattr__,
+        "__doc__": f"{class_name} 的懒加载代理（{module_name}）",
+    }
+    for attr_name in MANIFEST_ATTRS:
+        if attr_name in info:
+            value = info[attr_name]
+            attrs[attr_name] = tuple(value) if attr_name in MANIFEST_TUPLE_ATTRS else value
+    
+    for method_name in info.get("classmethods", []):
+        def forward(cls, *args, _method_name=method_name, **kwargs):
+            return getattr(real_class(), _method_name)(*args, **kwargs)
+        attrs[method_name] = classmethod(forward)
+    
+    return type(class_name, (object,), attrs)
+
 # 动态发现并加载节点模块
 def discover_and_load_nodes():
     """自动发现并加载 nodes 目录下的所有节点模块"""
@@ -54,83 +404,56 @@ def discover_and_load_nodes():
     
     print(f"🔄 在 nodes 目录中发现 {len(python_files)} 个Python文件")
     
+    manifest = read_manifest() if LAZY_LOAD else {}
+    new_manifest = {}
+    
     for py_file in python_files:
         module_name = os.path.splitext(py_file)[0]
         file_path = os.path.join(nodes_dir, py_file)
         
-        print(f"🔍 正在加载模块: {module_name}")
-        module = load_module_from_file(module_name, file_path)
+        node_classes = {}
+        cached = manifest.get(py_file)
         
-        if module is None:
-            continue
+        if (LAZY_LOAD and cached and cached.get("stamp") == get_file_stamp(file_path)
+                and not dependencies_changed(cached.get("dependencies"))):
+            # 清单有效：注册代理类，不导入模块
+            print(f"💤 使用缓存清单注册模块: {module_name}")
+            for class_name, info in cached["nodes"].items():
+                node_classes[class_name] = make_lazy_node_class(module_name, file_path, class_name, info,
+                                                                cached.get("dependencies"))
+            new_manifest[py_file] = cached
+        else:
+            print(f"🔍 正在加载模块: {module_name}")
+            module = load_module_from_file(module_name, file_path)
             
-        # 查找模块中的节点类
-        for attr_name in dir(module):
-            attr = getattr(module, attr_name)
-            
-            # 检查是否是类且是有效的节点类
-            if (isinstance(attr, type) and 
-                hasattr(attr, 'INPUT_TYPES') and 
-                hasattr(attr, 'RETURN_TYPES') and 
-                hasattr(attr, 'FUNCTION') and 
-                hasattr(attr, 'CATEGORY')):
-                
-                # 添加到映射
-                node_class_mappings[attr_name] = attr
+            if module is None:
+                continue
                 
-                # 生成显示名称
-                display_name = attr_name
-                if attr_name.startswith('kktools'):
-                    display_name = f"kktools {attr_name[7:]}"
-                
-                # 添加中文描述
-                chinese_desc = ""
-                if 'Size' in attr_name:
-                    chinese_desc = " (尺寸)"
-                elif 'Batch' in attr_name:
-                    chinese_desc = " (批量提示词)"
-                elif 'Prompt' in attr_name:
-                    chinese_desc = " (AI提示词生成)"
-                elif 'String' in attr_name:
-                    if 'Merge' in attr_name:
-                        chinese_desc = " (字符串合并)"
-                    elif 'Input' in attr_name:
-                        chinese_desc = " (字符串/整数输入)"
-                    elif 'Replace' in attr_name:
-                        chinese_desc = " (字符串替换)"
-                    elif 'Advanced' in attr_name:
-                        chinese_desc = " (字符串裁剪-高级)"
-                    else:
-                        chinese_desc = " (字符串裁剪)"
-                elif 'Regex' in attr_name:
-                    if 'Advanced' in attr_name:
-                        chinese_desc = " (正则表达式-高级)"
-                    else:
-                        chinese_desc = " (正则表达式)"
-                elif 'PadImage' in attr_name:
-                    chinese_desc = " (图像填充到画布)"
-                elif 'ImageFrame' in attr_name:
-                    chinese_desc = " (图像边框)"
-                elif 'Resize_img_and_mask' in attr_name:
-                    chinese_desc = " (图像蒙版同步调整)"
-                elif 'GetImage' in attr_name:
-                    chinese_desc = " (获取图像尺寸)"
-                elif 'Resize' in attr_name:
-                    chinese_desc = " (图像蒙版同步调整)"
-                elif 'AIPromptOptimizer' in attr_name:
-                    chinese_desc = " (AI提示词优化)"
-                # 新增的节点名称映射
-                elif attr_name == 'InputNode':
-                    chinese_desc = " (多类型输入)"
-                elif attr_name == 'ReplaceNode':
-                    chinese_desc = " (字符串替换)"
-                elif attr_name == 'SomethingToAny':
-                    chinese_desc = " (任意类型转换)"
-                elif attr_name == 'MathExpressionNode':
-                    chinese_desc = " (数学表达式)"
-                
-                node_display_name_mappings[attr_name] = f"{display_name}{chinese_desc}"
-                print(f"      ✅ 注册节点: {attr_name} -> {node_display_name_mappings[attr_name]}")
+            # 查找模块中的节点类
+            for attr_name in dir(module):
+                attr = getattr(module, attr_name)
+                if is_node_class(attr):
+                    node_classes[attr_name] = attr
+            
+            if LAZY_LOAD:
+                descriptions = {name: describe_node_class(cls) for name, cls in node_classes.items()}
+                if all(info is not None for info in descriptions.values()):
+                    new_manifest[py_file] = {
+                        "stamp": get_file_stamp(file_path),
+                        "dependencies": get_dependency_stamps(getattr(module, MANIFEST_DEPENDENCIES_ATTR, [])),
+                        "nodes": descriptions,
+                    }
+        
+        for attr_name, node_class in node_classes.items():
+            # 添加到映射
+            node_class_mappings[attr_name] = node_class
+            node_display_name_mappings[attr_name] = get_display_name(attr_name)
+            print(f"      ✅ 注册节点: {attr_name} -> {node_display_name_mappings[attr_name]}")
+    
+    if LAZY_LOAD and new_manifest != manifest:
+        write_manifest(new_manifest)
+    
+    write_import_report()
     
     return node_class_mappings, node_display_name_mappings
 
@@ -170,6 +493,23 @@ if not NODE_CLASS_MAPPINGS:
 
 print(f"✅ kktools Nodes 加载完成！共注册 {len(NODE_CLASS_MAPPINGS)} 个节点\n")
 
+# 字体刷新接口：POST /kktools/fonts/refresh 重新扫描字体目录（仅在 ComfyUI 服务器中注册）
+# 在包入口注册，懒加载模式下 image.py 尚未导入时也可用；字体目录 mtime 变化后 ImageFrame 的选项列表不再使用清单缓存
+try:
+    from aiohttp import web
+    from server import PromptServer
+
+    @PromptServer.instance.routes.post("/kktools/fonts/refresh")
+    async def refresh_fonts_route(request):
+        global DEPENDENCIES_REFRESHED
+        DEPENDENCIES_REFRESHED = True
+        if nodes_dir not in sys.path:
+            sys.path.append(nodes_dir)
+        from _kktools_fonts import refresh_fonts
+        return web.json_response({"custom_fonts": refresh_fonts()})
+except Exception:
+    pass
+
 # 导出
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
 
@@ -0,0 +1,240 @@
+"""
+kktools 解码图像缓存
+进程内 LRU 缓存（按字节预算淘汰）+ 可选的磁盘缓存（内存映射 .npy，按字节预算清理最久未使用的文件），
+供 BatchImageLoader 跨执行复用解码结果
+另有图像头缓存（尺寸、模式等元数据），分组/筛选时不必重复打开文件
+缓存键为 (路径, mtime, 大小, 转换模式)，调用方传入解码/探测时重新 stat 的条目，文件被修改后自动失效
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 内存缓存预算（MB），可通过环境变量调整
+DEFAULT_CACHE_MB = int(os.environ.get("KKTOOLS_DECODE_CACHE_MB", "1024"))
+
+# 磁盘缓存预算（MB，0=不限制）
+DEFAULT_DISK_CACHE_MB = int(os.environ.get("KKTOOLS_DECODE_CACHE_DISK_MB", "10240"))
+
+# 磁盘缓存超出预算时清理到预算的该比例，避免每次写入都触发清理
+DISK_SWEEP_TARGET = 0.9
+
+# 图像头缓存容量（条目数）
+HEADER_CACHE_ENTRIES = 200000
+
+# 磁盘缓存目录
+DEFAULT_CACHE_DIR = os.environ.get("KKTOOLS_DECODE_CACHE_DIR",
+                                   os.path.join(tempfile.gettempdir(), "kktools_decode_cache"))
+
+
+class DecodedImageCache:
+    """解码后的 uint8 帧的进程内 LRU 缓存，总字节数超过预算时淘汰最久未使用的帧"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        """获取缓存的帧（只读数组），未命中返回 None"""
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+            return frame
+
+    def put(self, key, frame):
+        """缓存一帧，单帧超过预算时不缓存"""
+        if frame.nbytes > self.max_bytes:
+            return
+        frame.setflags(write=False)
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._frames[key] = frame
+            self._bytes += frame.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"frames": len(self._frames), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+class DiskImageCache:
+    """
+    磁盘缓存：每帧保存为 .npy 文件，读取时内存映射，不需要重新解码
+
+    总大小超过 max_bytes 时按文件 mtime 删除最久未使用的文件（命中时更新 mtime）；
+    已用字节数为估计值，每次清理时重新统计目录，多个进程共用目录时也会收敛
+    """
+
+    def __init__(self, cache_dir, max_bytes=0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = None
+
+    def _path_for(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.npy")
+
+    def get(self, key):
+        """读取缓存帧（只读内存映射），未命中或文件损坏返回 None"""
+        path = self._path_for(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            frame = np.load(path, mmap_mode="r")
+        except Exception:
+            return None
+        try:
+            # 更新 mtime，清理时最近使用的文件最后被删除
+            os.utime(path)
+        except OSError:
+            pass
+        return frame
+
+    def put(self, key, frame):
+        """原子写入一帧（先写临时文件再替换），超出预算时清理旧文件"""
+        if self.max_bytes > 0 and frame.nbytes > self.max_bytes:
+            return
+        path = self._path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.save(f, frame)
+            os.replace(tmp_path, path)
+            written = os.path.getsize(path)
+        except Exception as e:
+            print(f"⚠️ 写入解码缓存失败 {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        if self.max_bytes > 0:
+            with self._lock:
+                if self._bytes is None:
+                    self._bytes = sum(size for _, size, _ in self._list_files())
+                else:
+                    self._bytes += written
+                if self._bytes > self.max_bytes:
+                    self._sweep()
+
+    def _list_files(self):
+        """缓存目录中的 .npy 文件：(mtime, 大小, 路径)"""
+        files = []
+        for root, dirs, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".npy"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime_ns, stat.st_size, path))
+        return files
+
+    def _sweep(self):
+        """按 mtime 从旧到新删除文件，直到总大小降到预算的 DISK_SWEEP_TARGET 以下（调用方持有锁）"""
+        files = sorted(self._list_files())
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_bytes * DISK_SWEEP_TARGET)
+        removed = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._bytes = total
+        print(f"🧹 解码磁盘缓存清理: 删除 {removed} 个文件，剩余 {total // (1024 * 1024)} MB")
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._list_files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._bytes = 0
+
+
+class HeaderCache:
+    """图像头信息的 LRU 缓存，按条目数淘汰"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._headers = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            header = self._headers.get(key)
+            if header is not None:
+                self._headers.move_to_end(key)
+            return header
+
+    def put(self, key, header):
+        with self._lock:
+            self._headers[key] = header
+            self._headers.move_to_end(key)
+            while len(self._headers) > self.max_entries:
+                self._headers.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._headers.clear()
+
+
+MEMORY_CACHE = DecodedImageCache(DEFAULT_CACHE_MB * 1024 * 1024)
+DISK_CACHE = DiskImageCache(DEFAULT_CACHE_DIR, DEFAULT_DISK_CACHE_MB * 1024 * 1024)
+HEADER_CACHE = HeaderCache(HEADER_CACHE_ENTRIES)
+
+
+def make_cache_key(entry, mode):
+    """根据文件索引条目和转换模式生成缓存键（目录文件的条目应为 refresh_entry 重新 stat 后的条目）"""
+    return (entry.path, entry.mtime_ns, entry.size, mode)
+
+
+def make_header_key(entry):
+    """图像头缓存键（与转换模式无关）"""
+    return (entry.path, entry.mtime_ns, entry.size)
+
+
+def get_cached_frame(key, use_disk=False):
+    """
+    依次查找内存缓存和磁盘缓存
+
+    磁盘命中的内存映射帧不放入内存缓存：按 nbytes 计入预算会挤掉真正占用内存的解码帧，
+    而页面缓存已经保存了最近读取的文件
+    """
+    frame = MEMORY_CACHE.get(key)
+    if frame is None and use_disk:
+        frame = DISK_CACHE.get(key)
+    return frame
+
+
+def put_cached_frame(key, frame, use_disk=False):
+    """将解码后的帧放入内存缓存（以及磁盘缓存）"""
+    MEMORY_CACHE.put(key, frame)
+    if use_disk:
+        DISK_CACHE.put(key, frame)
@@ -0,0 +1,94 @@
+"""
+kktools 共享张量/PIL 转换层
+供 image.py 中所有图像节点使用：每批只做一次 uint8 量化，结果直接写入预分配的输出张量
+"""
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+def normalize_mask(mask_tensor):
+    """将蒙版统一为 ComfyUI 标准形状 (Batch, H, W)"""
+    if mask_tensor.dim() == 2:
+        return mask_tensor.unsqueeze(0)
+    if mask_tensor.dim() == 4:
+        return mask_tensor[..., 0]
+    return mask_tensor
+
+
+# 每次量化的浮点临时缓冲区预算（字节），临时内存与批次大小无关
+QUANTIZE_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def tensor_to_uint8(tensor):
+    """
+    将 [0, 1] 浮点张量整批量化为 uint8 numpy 数组
+
+    预分配 uint8 输出，按帧分块量化（乘 255、原地裁剪、截断转换写入输出），浮点临时缓冲区只有一个分块大小并重复使用；
+    量化在张量所在设备上完成，GPU 张量只传输 uint8 数据
+    """
+    tensor = tensor.detach()
+    if not tensor.is_floating_point():
+        tensor = tensor.float()
+    out = torch.empty(tensor.shape, dtype=torch.uint8, device=tensor.device)
+    if tensor.dim() == 0 or tensor.numel() == 0:
+        out.copy_(tensor.mul(255.0).clamp_(0, 255))
+        return out.cpu().numpy()
+    frame_bytes = max(1, tensor[0].numel() * tensor.element_size())
+    chunk = max(1, QUANTIZE_CHUNK_BYTES // frame_bytes)
+    buffer = torch.empty((min(chunk, tensor.shape[0]),) + tuple(tensor.shape[1:]), dtype=tensor.dtype,
+                         device=tensor.device)
+    for start in range(0, tensor.shape[0], chunk):
+        end = min(start + chunk, tensor.shape[0])
+        tmp = buffer[:end - start]
+        torch.mul(tensor[start:end], 255.0, out=tmp).clamp_(0, 255)
+        out[start:end].copy_(tmp)
+    return out.cpu().numpy()
+
+
+def tensor_to_pil(img_tensor):
+    """将 ComfyUI 图像张量 (Batch, H, W, C) 或单张 (H, W, C) 转换为 PIL 图像列表"""
+    if img_tensor.dim() == 3:
+        img_tensor = img_tensor.unsqueeze(0)
+    batch_np = tensor_to_uint8(img_tensor)
+    if batch_np.shape[-1] == 1:
+        batch_np = batch_np[..., 0]
+    # 每帧是整批数组的视图，L/RGBA 模式下 PIL 直接共享这块内存
+    return [Image.fromarray(batch_np[i]) for i in range(batch_np.shape[0])]
+
+
+def mask_to_pil(mask_tensor):
+    """将蒙版张量转换为 L 模式 PIL 图像列表"""
+    if mask_tensor is None:
+        return None
+    batch_np = tensor_to_uint8(normalize_mask(mask_tensor))
+    return [Image.fromarray(batch_np[i]) for i in range(batch_np.shape[0])]
+
+
+def pil_to_tensor(pil_images):
+    """
+    将 PIL 图像列表转换回 ComfyUI 图像张量 (Batch, H, W, C)
+
+    每帧直接写入预分配的 float32 输出（uint8 -> float32 在写入时转换），最后整批一次归一化，
+    不再逐帧创建 float32 临时数组再 torch.cat
+    """
+    first = np.asarray(pil_images[0])
+    out = torch.empty((len(pil_images),) + first.shape, dtype=torch.float32)
+
+    out_np = out.numpy()
+    out_np[0] = first
+    for i in range(1, len(pil_images)):
+        frame = np.asarray(pil_images[i])
+        if frame.shape != first.shape:
+            raise ValueError(f"批次中的图像尺寸不一致: {frame.shape} != {first.shape}")
+        out_np[i] = frame
+    out.div_(255.0)
+    return out
+
+
+def pil_to_mask(pil_masks):
+    """将 PIL 蒙版列表转换回 ComfyUI 蒙版张量 (Batch, H, W)"""
+    if pil_masks is None:
+        return None
+    return pil_to_tensor([mask if mask.mode == "L" else mask.convert("L") for mask in pil_masks])
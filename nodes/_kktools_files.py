@@ -0,0 +1,196 @@
+"""
+kktools 共享文件索引
+目录扫描索引（单次 os.scandir，按目录 mtime 失效）和 tar/zip 分片的成员索引（按分片 mtime/大小失效），
+供 BatchImageLoader 使用
+"""
+
+import os
+import tarfile
+import threading
+import zipfile
+from collections import namedtuple
+
+# 目录中的一个文件：文件名、完整路径、大小、修改时间、小写扩展名（不含点）
+# 分片成员额外记录所在分片路径和数据偏移，路径为 "分片路径::成员名"
+FileEntry = namedtuple("FileEntry", ["name", "path", "size", "mtime_ns", "ext", "archive", "offset"],
+                       defaults=(None, None))
+
+# 支持的分片格式
+ARCHIVE_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".zip")
+
+
+class DirectoryIndex:
+    """
+    按目录缓存文件列表，只有目录 mtime 变化（增删/重命名文件）时才重新扫描
+
+    原地覆盖文件不会改变目录 mtime，条目中的大小和修改时间可能已过期，依赖它们的调用方需使用 refresh_entry
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def scan(self, directory):
+        """
+        获取目录中所有普通文件（不含隐藏文件和子目录），按文件名排序
+
+        Returns:
+            FileEntry 列表
+        """
+        directory = os.path.abspath(directory)
+        dir_mtime = os.stat(directory).st_mtime_ns
+        with self._lock:
+            cached = self._cache.get(directory)
+            if cached is not None and cached[0] == dir_mtime:
+                return cached[1]
+
+        entries = []
+        with os.scandir(directory) as iterator:
+            for dir_entry in iterator:
+                if dir_entry.name.startswith('.'):
+                    continue
+                try:
+                    if not dir_entry.is_file():
+                        continue
+                    stat = dir_entry.stat()
+                except OSError:
+                    continue
+                ext = os.path.splitext(dir_entry.name)[1][1:].lower()
+                entries.append(FileEntry(dir_entry.name, dir_entry.path, stat.st_size, stat.st_mtime_ns, ext))
+        entries.sort(key=lambda entry: entry.name)
+
+        with self._lock:
+            self._cache[directory] = (dir_mtime, entries)
+        return entries
+
+    def invalidate(self, directory=None):
+        """清除指定目录（或全部）的缓存"""
+        with self._lock:
+            if directory is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(os.path.abspath(directory), None)
+
+
+DIRECTORY_INDEX = DirectoryIndex()
+
+
+def scan_directory(directory):
+    """获取目录的文件索引（缓存）"""
+    return DIRECTORY_INDEX.scan(directory)
+
+
+def refresh_entry(entry):
+    """
+    重新获取目录文件的大小和修改时间（目录索引只在目录 mtime 变化时重建，原地覆盖的文件不会更新索引）；
+    分片成员的 mtime/大小来自分片本身，原样返回
+
+    Raises:
+        OSError: 文件已被删除或无法访问
+    """
+    if entry.archive is not None:
+        return entry
+    stat = os.stat(entry.path)
+    return entry._replace(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+
+def filter_by_extensions(entries, extensions):
+    """按扩展名（小写，不含点）筛选文件"""
+    extensions = set(extensions)
+    return [entry for entry in entries if entry.ext in extensions]
+
+
+def is_archive(path):
+    """路径是否为支持的 tar/zip 分片文件"""
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+class ArchiveIndex:
+    """按分片缓存成员列表，只有分片 mtime 或大小变化时才重新读取成员目录"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def scan(self, archive):
+        """
+        获取分片中所有普通文件成员（不含隐藏文件和目录），按成员名排序
+
+        成员的 mtime 使用分片的 mtime，分片被替换后基于 mtime 的解码缓存随之失效
+
+        Returns:
+            FileEntry 列表
+        """
+        archive = os.path.abspath(archive)
+        stat = os.stat(archive)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(archive)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+
+        entries = []
+        for member_name, size, offset in self._read_members(archive):
+            base_name = member_name.rsplit("/", 1)[-1]
+            if not base_name or base_name.startswith('.') or member_name.startswith("__MACOSX/"):
+                continue
+            ext = os.path.splitext(base_name)[1][1:].lower()
+            entries.append(FileEntry(member_name, f"{archive}::{member_name}", size, stat.st_mtime_ns, ext,
+                                     archive, offset))
+        entries.sort(key=lambda entry: entry.name)
+        print(f"🎯 分片索引已建立: {archive}，共 {len(entries)} 个文件")
+
+        with self._lock:
+            self._cache[archive] = (stamp, entries)
+        return entries
+
+    def _read_members(self, archive):
+        """读取成员目录：(成员名, 大小, 偏移)"""
+        if archive.lower().endswith(".zip"):
+            with zipfile.ZipFile(archive) as zf:
+                return [(info.filename, info.file_size, info.header_offset)
+                        for info in zf.infolist() if not info.is_dir()]
+        with tarfile.open(archive, "r:*") as tar:
+            return [(member.name, member.size, member.offset_data)
+                    for member in tar.getmembers() if member.isfile()]
+
+
+ARCHIVE_INDEX = ArchiveIndex()
+
+
+def scan_archive(archive):
+    """获取分片的成员索引（缓存）"""
+    return ARCHIVE_INDEX.scan(archive)
+
+
+def read_archive_members(entries, limit=None):
+    """
+    按分片内的偏移顺序一次顺序读取成员数据（每个分片只打开一次）
+
+    Args:
+        entries: 分片成员 FileEntry 列表
+        limit: 每个成员最多读取的字节数（None=全部，用于只解析图像头）
+
+    Returns:
+        {成员路径: bytes}
+    """
+    by_archive = {}
+    for entry in entries:
+        by_archive.setdefault(entry.archive, []).append(entry)
+
+    payloads = {}
+    for archive, members in by_archive.items():
+        members.sort(key=lambda entry: entry.offset)
+        if archive.lower().endswith(".zip"):
+            with zipfile.ZipFile(archive) as zf:
+                for entry in members:
+                    with zf.open(entry.name) as member_file:
+                        payloads[entry.path] = member_file.read(-1 if limit is None else limit)
+        else:
+            # tar 成员数据连续存放：按偏移定位后直接读取（压缩分片由 tarfile 提供可定位的解压流）
+            with tarfile.open(archive, "r:*") as tar:
+                fileobj = tar.fileobj
+                for entry in members:
+                    fileobj.seek(entry.offset)
+                    payloads[entry.path] = fileobj.read(entry.size if limit is None else min(limit, entry.size))
+    return payloads
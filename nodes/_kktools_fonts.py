@@ -0,0 +1,186 @@
+"""
+kktools 共享字体解析
+进程级字体索引（按目录 mtime 失效）和已加载字体的 LRU 缓存，供 ImageFrame 使用
+"""
+
+import os
+import time
+import threading
+from functools import lru_cache
+
+from PIL import ImageFont
+
+# nodes 目录
+nodes_dir = os.path.dirname(os.path.abspath(__file__))
+
+# 字体目录：主要目录 + 备用目录（兼容旧路径），按顺序搜索
+FONT_DIRS = [
+    os.path.join(nodes_dir, 'fonts'),
+    os.path.join(nodes_dir, '..', 'fonts'),
+    os.path.join(nodes_dir, '..', '..', 'fonts'),
+]
+
+# 支持的字体文件扩展名（用于自定义字体选项列表）
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc')
+
+# 两次目录 mtime 检查之间的最小间隔（秒），避免频繁的 /object_info 请求反复 stat 网络盘
+STALE_CHECK_INTERVAL = 2.0
+
+# 系统字体名称映射
+SYSTEM_FONT_MAPPING = {
+    "Arial": "arial.ttf",
+    "Arial Bold": "arialbd.ttf",
+    "Arial Italic": "ariali.ttf",
+    "Arial Bold Italic": "arialbi.ttf",
+    "DejaVu Sans": "DejaVuSans.ttf",
+    "DejaVu Sans Bold": "DejaVuSans-Bold.ttf",
+    "DejaVu Sans Oblique": "DejaVuSans-Oblique.ttf",
+    "Liberation Sans": "LiberationSans-Regular.ttf",
+    "Liberation Sans Bold": "LiberationSans-Bold.ttf",
+    "Liberation Sans Italic": "LiberationSans-Italic.ttf",
+}
+
+# 映射失败时依次尝试的常见系统字体
+SYSTEM_FONT_FALLBACKS = [
+    "arial.ttf", "arialbd.ttf", "ariali.ttf", "arialbi.ttf",
+    "DejaVuSans.ttf", "DejaVuSans-Bold.ttf", "DejaVuSans-Oblique.ttf",
+    "LiberationSans-Regular.ttf", "LiberationSans-Bold.ttf", "LiberationSans-Italic.ttf",
+]
+
+# 已加载字体的 LRU 容量（按 (路径, 字号) 计，加载失败的结果也会占用条目）
+FONT_CACHE_SIZE = 64
+
+
+def get_dir_mtime(path):
+    """获取目录 mtime，目录不存在时返回 None"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class FontIndex:
+    """进程级字体索引：字体名/文件名 -> 字体文件路径，任一已扫描目录的 mtime 变化时重建"""
+
+    def __init__(self, font_dirs):
+        self.font_dirs = font_dirs
+        self._lock = threading.Lock()
+        self._dir_stamps = None
+        self._last_check = 0.0
+        self._paths = {}
+        self._custom_fonts = []
+
+    def _is_stale(self):
+        if self._dir_stamps is None:
+            return True
+        now = time.monotonic()
+        if now - self._last_check < STALE_CHECK_INTERVAL:
+            return False
+        self._last_check = now
+        return any(get_dir_mtime(path) != mtime for path, mtime in self._dir_stamps)
+
+    def _ensure_fresh(self):
+        if self._is_stale():
+            self._rebuild()
+
+    def _rebuild(self):
+        dir_stamps = []
+        paths = {}
+        custom_fonts = []
+        for font_dir in self.font_dirs:
+            # 不存在的目录也记录下来，创建后索引会失效
+            dir_stamps.append((font_dir, get_dir_mtime(font_dir)))
+            if not os.path.isdir(font_dir):
+                continue
+            for root, dirs, files in os.walk(font_dir):
+                if root != font_dir:
+                    dir_stamps.append((root, get_dir_mtime(root)))
+                for file in files:
+                    # 文件名和不带扩展名的名称都可以匹配，先找到的优先
+                    font_path = os.path.join(root, file)
+                    font_name = os.path.splitext(file)[0]
+                    paths.setdefault(file.lower(), font_path)
+                    paths.setdefault(font_name.lower(), font_path)
+                    # 选项列表只包含各字体目录顶层的字体文件（使用不带扩展名的文件名作为显示名称）
+                    if (root == font_dir and file.lower().endswith(FONT_EXTENSIONS)
+                            and font_name not in custom_fonts):
+                        custom_fonts.append(font_name)
+        self._paths = paths
+        self._custom_fonts = custom_fonts
+        self._dir_stamps = dir_stamps
+        self._last_check = time.monotonic()
+        print(f"🎯 字体索引已更新，共找到 {len(custom_fonts)} 个自定义字体")
+
+    def find(self, font_name):
+        """根据字体名称查找字体文件路径，未找到返回 None"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._paths.get(font_name.lower())
+
+    def custom_fonts(self):
+        """获取自定义字体名称列表（缓存，目录 mtime 变化时自动更新）"""
+        with self._lock:
+            self._ensure_fresh()
+            return list(self._custom_fonts)
+
+    def refresh(self):
+        """立即重新扫描字体目录（不等待 mtime 检查间隔）"""
+        with self._lock:
+            self._rebuild()
+            return list(self._custom_fonts)
+
+
+FONT_INDEX = FontIndex(FONT_DIRS)
+
+
+def find_font_file(font_name):
+    """根据字体名称查找字体文件"""
+    return FONT_INDEX.find(font_name)
+
+
+def find_custom_fonts():
+    """获取自定义字体名称列表"""
+    return FONT_INDEX.custom_fonts()
+
+
+def refresh_fonts():
+    """强制重新扫描字体目录，返回最新的自定义字体名称列表"""
+    return FONT_INDEX.refresh()
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_truetype(font_ref, font_size, mtime=None):
+    """加载 TrueType 字体并缓存（mtime 参与缓存键，字体文件被替换后会重新解析），失败时返回 None"""
+    try:
+        font = ImageFont.truetype(font_ref, font_size)
+    except Exception:
+        return None
+    print(f"✅ 加载字体: {font_ref} (字号 {font_size})")
+    return font
+
+
+def get_font(font_size, font_selection="Arial"):
+    """加载字体 - 按照1自定义文件2系统文件的顺序，每种 (字体, 字号) 只解析一次"""
+    # 1. 首先尝试作为自定义字体文件加载
+    found_font_path = find_font_file(font_selection)
+    if found_font_path:
+        try:
+            mtime = os.stat(found_font_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        custom_font = load_truetype(found_font_path, font_size, mtime)
+        if custom_font is not None:
+            return custom_font
+        print(f"⚠️ 无法加载自定义字体文件 {found_font_path}")
+
+    # 2. 如果自定义字体失败，尝试系统字体
+    font_file = SYSTEM_FONT_MAPPING.get(font_selection)
+    candidates = ([font_file] if font_file else []) + SYSTEM_FONT_FALLBACKS
+    for font_name in candidates:
+        system_font = load_truetype(font_name, font_size)
+        if system_font is not None:
+            return system_font
+
+    # 如果系统字体都失败，使用备用字体
+    print("⚠️ 无法加载系统字体，使用备用字体")
+    return ImageFont.load_default()
@@ -0,0 +1,77 @@
+"""
+kktools 共享线程池
+所有 kktools 节点的逐帧/逐文件并行任务共用一个有界线程池（PIL 缩放/粘贴、图像解码等会释放 GIL），
+总线程数由 KKTOOLS_WORKERS 环境变量限制；在池线程内再次发起的并行调用直接串行执行，嵌套调用不会超额占用 CPU
+"""
+
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# 共享线程池大小（也是 num_workers=0 时的自动线程数）
+DEFAULT_WORKERS = max(1, int(os.environ.get("KKTOOLS_WORKERS", str(min(32, os.cpu_count() or 1)))))
+
+_executor_lock = threading.Lock()
+_executor = None
+_local = threading.local()
+
+
+def get_executor():
+    """获取（按需创建）共享线程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DEFAULT_WORKERS, thread_name_prefix="kktools-worker")
+        return _executor
+
+
+def in_worker():
+    """当前线程是否正在执行共享线程池中的任务"""
+    return getattr(_local, "active", False)
+
+
+def resolve_workers(num_workers, item_count):
+    """确定并行线程数 (0=自动，即共享线程池大小)，不超过任务数"""
+    if num_workers <= 0:
+        num_workers = DEFAULT_WORKERS
+    return max(1, min(num_workers, item_count))
+
+
+def run_parallel(func, items, workers):
+    """
+    对 items 逐项执行 func，按输入顺序返回结果
+
+    workers > 1 时最多占用 workers 个共享池线程，各线程动态领取下一项；
+    workers <= 1、只有一项或已在池线程内（嵌套调用）时在当前线程串行执行。任一项抛出异常时其余线程停止领取并重新抛出
+    """
+    items = list(items)
+    workers = min(workers, len(items))
+    if workers <= 1 or in_worker():
+        return [func(item) for item in items]
+
+    results = [None] * len(items)
+    counter = itertools.count()
+    failed = threading.Event()
+
+    def run_items():
+        _local.active = True
+        try:
+            while not failed.is_set():
+                index = next(counter)
+                if index >= len(items):
+                    return
+                try:
+                    results[index] = func(items[index])
+                except BaseException:
+                    failed.set()
+                    raise
+        finally:
+            _local.active = False
+
+    executor = get_executor()
+    futures = [executor.submit(run_items) for _ in range(workers)]
+    wait(futures)
+    for future in futures:
+        future.result()
+    return results
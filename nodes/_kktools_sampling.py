@@ -0,0 +1,90 @@
+"""
+kktools 可复现随机抽样
+使用独立的随机数生成器按需生成 range(n) 的随机排列（稀疏 Fisher-Yates），取前 k 个只需 O(k)，
+不修改全局 random 状态；同一 (n, 种子) 的排列前缀稳定，供 BatchImageLoader 随机加载和游标无放回抽样使用
+"""
+
+import random
+import threading
+from collections import OrderedDict
+
+# 保留的排列数量（游标模式连续批次复用已生成的前缀）
+PERMUTATION_CACHE_SIZE = 8
+
+
+class SeededPermutation:
+    """range(n) 的随机排列，只生成已访问位置之前的部分，只记录被交换过的位置"""
+
+    def __init__(self, n, seed=None):
+        self.n = n
+        self._rng = random.Random(seed)
+        self._swapped = {}
+        self._prefix = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.n
+
+    def at(self, index):
+        """获取排列中第 index 个元素（按需生成到该位置）"""
+        if index >= len(self._prefix):
+            with self._lock:
+                prefix = self._prefix
+                swapped = self._swapped
+                while len(prefix) <= index:
+                    i = len(prefix)
+                    j = self._rng.randrange(i, self.n)
+                    value = swapped.pop(j, j)
+                    if j != i:
+                        swapped[j] = swapped.pop(i, i)
+                    prefix.append(value)
+        return self._prefix[index]
+
+
+class PermutationView:
+    """排列的切片视图：切片只组合 range，不生成元素；读取时才按需生成"""
+
+    def __init__(self, permutation, indices=None):
+        self.permutation = permutation
+        self.indices = range(len(permutation)) if indices is None else indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return PermutationView(self.permutation, self.indices[key])
+        return self.permutation.at(self.indices[key])
+
+    def __iter__(self):
+        for index in self.indices:
+            yield self.permutation.at(index)
+
+
+_cache_lock = threading.Lock()
+_permutations = OrderedDict()
+
+
+def seeded_permutation(n, seed):
+    """获取 range(n) 按种子生成的随机排列视图（同一 (n, 种子) 复用已生成的前缀）"""
+    key = (n, seed)
+    with _cache_lock:
+        permutation = _permutations.get(key)
+        if permutation is None:
+            permutation = SeededPermutation(n, seed)
+            _permutations[key] = permutation
+            while len(_permutations) > PERMUTATION_CACHE_SIZE:
+                _permutations.popitem(last=False)
+        else:
+            _permutations.move_to_end(key)
+    return PermutationView(permutation)
+
+
+def random_permutation(n):
+    """获取 range(n) 的一次性随机排列视图（不可复现，也不修改全局 random 状态）"""
+    return PermutationView(SeededPermutation(n))
+
+
+def new_seed():
+    """生成新的随机种子（游标模式下种子为 0 时每轮使用一个新种子）"""
+    return random.SystemRandom().randrange(1, 2 ** 32)
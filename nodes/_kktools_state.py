@@ -0,0 +1,187 @@
+"""
+kktools 持久化状态
+保存跨执行/跨重启的节点状态：BatchImageLoader 的游标位置（JSON 文件）和监视模式的已处理文件账本（追加写入的 JSON Lines 文件）
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+# 包根目录
+package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_state_dir():
+    """获取状态目录：KKTOOLS_STATE_DIR > ComfyUI user 目录 > 包目录下的 .kktools_state"""
+    state_dir = os.environ.get("KKTOOLS_STATE_DIR", "").strip()
+    if not state_dir:
+        try:
+            import folder_paths
+            state_dir = os.path.join(folder_paths.get_user_directory(), "kktools")
+        except Exception:
+            state_dir = os.path.join(package_dir, ".kktools_state")
+    os.makedirs(state_dir, exist_ok=True)
+    return state_dir
+
+
+class JsonStateStore:
+    """键值状态文件，每次修改后原子写回"""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self._data = None
+
+    @property
+    def path(self):
+        return os.path.join(get_state_dir(), self.file_name)
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._load().get(key, default)
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, values):
+        """批量修改并只写回一次"""
+        with self._lock:
+            data = self._load()
+            data.update(values)
+            path = self.path
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"⚠️ 写入状态文件失败 {path}: {e}")
+
+
+# BatchImageLoader 游标位置（按目录保存，值中按影响文件顺序的参数签名区分）
+CURSOR_STORE = JsonStateStore("batch_image_loader_cursors.json")
+
+
+class JsonLinesLedger:
+    """
+    已处理文件账本：每次只把新增/删除的记录追加到 JSON Lines 文件，启动时重放到内存，
+    写入开销与本次处理的文件数成正比，与账本总大小无关；日志行数超过存活记录的 COMPACT_RATIO 倍时原子重写
+    """
+
+    # 日志行数 / 存活记录数超过该比例时压缩
+    COMPACT_RATIO = 2
+
+    # 存活记录较少时按该数量计算压缩阈值，小账本不会每次追加都重写
+    COMPACT_MIN_RECORDS = 1024
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self._data = None
+        self._lines = 0
+
+    @property
+    def path(self):
+        return os.path.join(get_state_dir(), self.file_name)
+
+    def _load(self):
+        if self._data is not None:
+            return self._data
+        self._data = {}
+        self._lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        name, stamp = record["name"], record["stamp"]
+                    except (ValueError, KeyError, TypeError):
+                        # 进程中断时最后一行可能不完整
+                        continue
+                    self._lines += 1
+                    if stamp is None:
+                        self._data.pop(name, None)
+                    else:
+                        self._data[name] = stamp
+        except OSError:
+            pass
+        return self._data
+
+    def get(self, name):
+        """获取文件的 [mtime_ns, 大小] 记录，没有时返回 None"""
+        with self._lock:
+            return self._load().get(name)
+
+    def update(self, values):
+        """记录文件名 -> [mtime_ns, 大小]，只追加变化的记录"""
+        with self._lock:
+            data = self._load()
+            changed = {name: stamp for name, stamp in values.items() if data.get(name) != stamp}
+            data.update(changed)
+            self._append(changed)
+
+    def prune(self, names):
+        """删除不在 names（当前扫描结果）中的记录，返回删除的数量"""
+        with self._lock:
+            data = self._load()
+            # 没有文件被删除时（扫描结果包含全部记录）只需遍历扫描结果，不遍历整个账本
+            if sum(1 for name in names if name in data) == len(data):
+                return 0
+            removed = [name for name in data if name not in names]
+            for name in removed:
+                del data[name]
+            self._append({name: None for name in removed})
+            return len(removed)
+
+    def _append(self, records):
+        if not records:
+            return
+        path = self.path
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps({"name": name, "stamp": stamp}, ensure_ascii=False) + "\n"
+                                for name, stamp in records.items()))
+            self._lines += len(records)
+        except Exception as e:
+            print(f"⚠️ 写入账本失败 {path}: {e}")
+            return
+        if self._lines > self.COMPACT_RATIO * max(len(self._data), self.COMPACT_MIN_RECORDS):
+            self._compact()
+
+    def _compact(self):
+        """只保留存活记录，原子重写日志"""
+        path = self.path
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write("".join(json.dumps({"name": name, "stamp": stamp}, ensure_ascii=False) + "\n"
+                                for name, stamp in self._data.items()))
+            os.replace(tmp_path, path)
+            self._lines = len(self._data)
+        except Exception as e:
+            print(f"⚠️ 压缩账本失败 {path}: {e}")
+
+
+_ledger_lock = threading.Lock()
+_ledgers = {}
+
+
+def get_ledger_store(directory):
+    """获取目录的已处理文件账本（文件名 -> [mtime_ns, 大小]），每个目录单独一个状态文件"""
+    with _ledger_lock:
+        store = _ledgers.get(directory)
+        if store is None:
+            digest = hashlib.sha1(directory.encode("utf-8")).hexdigest()[:16]
+            store = JsonLinesLedger(f"batch_image_loader_ledger_{digest}.jsonl")
+            _ledgers[directory] = store
+        return store
@@ -1,9 +1,35 @@
 import torch
 import numpy as np
-from PIL import Image, ImageColor, ImageDraw, ImageFont
+from PIL import Image, ImageColor, ImageDraw
+from PIL.PngImagePlugin import PngInfo
+import io
 import os
-import glob
-import random
+import json
+import sys
+import math
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# nodes 目录加入 Python 路径末尾（不覆盖标准库），用于导入共享辅助模块 _kktools_*.py
+# （文件名以下划线开头，不会被包入口的节点自动发现机制当作节点模块加载）
+nodes_dir = os.path.dirname(os.path.abspath(__file__))
+if nodes_dir not in sys.path:
+    sys.path.append(nodes_dir)
+
+from _kktools_convert import normalize_mask, tensor_to_pil, tensor_to_uint8, mask_to_pil, pil_to_tensor
+from _kktools_fonts import FONT_DIRS, find_custom_fonts, find_font_file, get_font, refresh_fonts
+from _kktools_files import (filter_by_extensions, is_archive, read_archive_members, refresh_entry, scan_archive,
+                            scan_directory)
+from _kktools_cache import HEADER_CACHE, get_cached_frame, make_cache_key, make_header_key, put_cached_frame
+from _kktools_state import CURSOR_STORE, get_ledger_store
+from _kktools_sampling import new_seed, random_permutation, seeded_permutation
+from _kktools_pool import resolve_workers, run_parallel
+
+# 懒加载清单的依赖路径：字体目录变化时 ImageFrame 的字体选项列表不使用清单缓存（见包入口 __init__.py）
+MANIFEST_DEPENDENCIES = FONT_DIRS
 
 class PadImageToCanvas:
     """
@@ -22,6 +48,11 @@ class PadImageToCanvas:
                 "center": ("BOOLEAN", {"default": True}),
                 "left_padding": ("INT", {"default": 0, "min": -8192, "max": 8192, "step": 1}),
                 "top_padding": ("INT", {"default": 0, "min": -8192, "max": 8192, "step": 1}),
+            },
+            "optional": {
+                "backend": (["torch", "pil"], {"default": "torch"}),
+                "num_workers": ("INT", {"default": 1, "min": 0, "max": 64, "step": 1,
+                                        "tooltip": "PIL 后端逐帧并行线程数 (1=串行, 0=自动)，使用 kktools 共享线程池；torch 后端忽略"}),
             }
         }
 
@@ -29,32 +60,8 @@ class PadImageToCanvas:
     FUNCTION = "pad_image"
     CATEGORY = "kktools/Image"
 
-    def tensor_to_pil(self, img_tensor):
-        """将 ComfyUI 图像张量 (Batch, H, W, C) 转换为 PIL 图像列表"""
-        batch_size, _, _, _ = img_tensor.shape
-        images = []
-        for i in range(batch_size):
-            img_np = 255. * img_tensor[i].cpu().numpy()
-            img = Image.fromarray(np.clip(img_np, 0, 255).astype(np.uint8))
-            images.append(img)
-        return images
-
-    def pil_to_tensor(self, pil_images):
-        """将 PIL 图像列表转换回 ComfyUI 图像张量"""
-        tensors = []
-        for img in pil_images:
-            img_np = np.array(img).astype(np.float32) / 255.0
-            tensor = torch.from_numpy(img_np)[None,]
-            tensors.append(tensor)
-        return torch.cat(tensors, dim=0)
-
-    def pad_image(self, image, width, height, fill_color, center, left_padding, top_padding):
-        # 1. 将输入的张量转换为 PIL 图像
-        pil_images = self.tensor_to_pil(image)
-        
-        processed_images = []
-
-        # 2. 解析填充颜色 (支持 #RGB, #RRGGBB, #RRGGBBAA)
+    def parse_fill_color(self, fill_color):
+        """解析填充颜色 (支持 #RGB, #RRGGBB, #RRGGBBAA)，返回 RGBA 元组"""
         try:
             # 尝试获取 RGBA 颜色，以便支持透明背景
             bg_color = ImageColor.getcolor(fill_color, "RGBA")
@@ -63,16 +70,80 @@ class PadImageToCanvas:
             bg_color = ImageColor.getcolor(fill_color, "RGB")
             # 如果是 RGB，我们需要手动添加一个不透明的 Alpha
             bg_color = bg_color + (255,)
+        return bg_color
+
+    def pad_image(self, image, width, height, fill_color, center, left_padding, top_padding, backend="torch", num_workers=1):
+        # 1. 解析填充颜色
+        bg_color = self.parse_fill_color(fill_color)
+
+        if backend == "pil":
+            return self.pad_image_pil(image, width, height, bg_color, center, left_padding, top_padding, num_workers)
+
+        batch_size, img_height, img_width, channels = image.shape
+
+        # 2. 根据背景色是否透明，决定输出是 RGB 还是 RGBA
+        out_channels = 3 if bg_color[3] == 255 else 4
 
-        for img in pil_images:
-            # 3. 确保输入图像为 RGBA 模式，以便在粘贴时正确处理透明度
+        # 3. 预分配整个批次的画布并填充背景色
+        fill = torch.tensor(bg_color[:out_channels], dtype=torch.float32, device=image.device) / 255.0
+        canvas = torch.empty((batch_size, height, width, out_channels), dtype=torch.float32, device=image.device)
+        canvas[:] = fill
+
+        # 4. 计算粘贴位置
+        if center:
+            x_pos = (width - img_width) // 2
+            y_pos = (height - img_height) // 2
+        else:
+            x_pos = left_padding
+            y_pos = top_padding
+
+        # 5. 计算画布与源图像的重叠区域（支持负边距裁剪）
+        dst_x0, dst_y0 = max(x_pos, 0), max(y_pos, 0)
+        dst_x1, dst_y1 = min(x_pos + img_width, width), min(y_pos + img_height, height)
+        if dst_x1 <= dst_x0 or dst_y1 <= dst_y0:
+            return (canvas,)
+        src_x0, src_y0 = dst_x0 - x_pos, dst_y0 - y_pos
+        src_x1, src_y1 = src_x0 + (dst_x1 - dst_x0), src_y0 + (dst_y1 - dst_y0)
+
+        src = image[:, src_y0:src_y1, src_x0:src_x1, :].clamp(0.0, 1.0)
+        if channels == 1:
+            src = src.expand(-1, -1, -1, 3)
+        region = canvas[:, dst_y0:dst_y1, dst_x0:dst_x1, :]
+
+        # 6. 一次切片赋值写入整个批次
+        if channels == 4:
+            # 使用源图像的 alpha 通道作为蒙版，与 PIL paste(mask=alpha) 的混合方式一致
+            alpha = src[..., 3:4]
+            region[..., :3] = src[..., :3] * alpha + region[..., :3] * (1.0 - alpha)
+            if out_channels == 4:
+                region[..., 3:4] = alpha * alpha + region[..., 3:4] * (1.0 - alpha)
+        else:
+            region[..., :3] = src[..., :3]
+            if out_channels == 4:
+                region[..., 3] = 1.0
+
+        return (canvas,)
+
+    def pad_image_pil(self, image, width, height, bg_color, center, left_padding, top_padding, num_workers=1):
+        """PIL 参考实现（逐帧 RGBA 粘贴，结果量化为 8 位），num_workers > 1 时各帧在共享线程池中并行处理"""
+        # 1. 将输入的张量转换为 PIL 图像
+        pil_images = tensor_to_pil(image)
+
+        # 预分配整批输出（背景不透明时输出 RGB，否则 RGBA），每帧写入自己的位置
+        out_channels = 3 if bg_color[3] == 255 else 4
+        output_tensor = torch.empty((len(pil_images), height, width, out_channels), dtype=torch.float32)
+        output_np = output_tensor.numpy()
+
+        def process(batch_idx):
+            img = pil_images[batch_idx]
+            # 2. 确保输入图像为 RGBA 模式，以便在粘贴时正确处理透明度
             img_rgba = img.convert("RGBA")
             img_width, img_height = img_rgba.size
 
-            # 4. 创建新的画布（始终为 RGBA 模式）
+            # 3. 创建新的画布（始终为 RGBA 模式）
             canvas = Image.new("RGBA", (width, height), bg_color)
 
-            # 5. 计算粘贴位置
+            # 4. 计算粘贴位置
             if center:
                 # 居中对齐
                 x_pos = (width - img_width) // 2
@@ -82,26 +153,32 @@ class PadImageToCanvas:
                 x_pos = left_padding
                 y_pos = top_padding
 
-            # 6. 将图像粘贴到画布上
+            # 5. 将图像粘贴到画布上
             # 我们使用 img_rgba 的 alpha 通道作为蒙版，以确保透明区域正确
             canvas.paste(img_rgba, (x_pos, y_pos), mask=img_rgba)
 
-            # 7. 根据背景色是否透明，决定最终输出是 RGB 还是 RGBA
+            # 6. 根据背景色是否透明，决定最终输出是 RGB 还是 RGBA
             if bg_color[3] == 255: # 如果背景是不透明的
-                processed_images.append(canvas.convert("RGB"))
-            else: # 如果背景是透明的
-                processed_images.append(canvas)
+                canvas = canvas.convert("RGB")
+            output_np[batch_idx] = np.asarray(canvas)
+
+        run_parallel(process, range(len(pil_images)), resolve_workers(num_workers, len(pil_images)))
 
-        # 8. 将处理后的 PIL 图像转换回张量
-        output_tensor = self.pil_to_tensor(processed_images)
+        # 7. 整批一次归一化
+        output_tensor.div_(255.0)
         
         return (output_tensor,)
 
 class ImageFrame:
     """
-    图像边框节点，用于显示1-3张图像进行视觉比较，并添加边框和标签
+    图像边框节点，用于显示1-3张图像进行视觉比较，并添加边框和标签；
+    contact_sheet 模式将整批图像排成自动行列的缩略图联系表
     """
 
+    # 联系表默认的输出长边上限，以及每次缩放的帧数（缩放内存与批次大小无关）
+    CONTACT_SHEET_MAX_SIDE = 4096
+    SCALE_CHUNK = 32
+
     @classmethod
     def INPUT_TYPES(s):
         # 获取可用字体列表
@@ -113,7 +190,7 @@ class ImageFrame:
                 "footer_height": ("INT", {"default": 100, "min": 0, "max": 1000, "step": 10}),
                 "font_size": ("INT", {"default": 50, "min": 10, "max": 200, "step": 5}),
                 "border_thickness": ("INT", {"default": 20, "min": 0, "max": 200, "step": 5}),
-                "mode": (["horizontal", "vertical", "grid"], {"default": "horizontal"}),
+                "mode": (["horizontal", "vertical", "grid", "contact_sheet"], {"default": "horizontal"}),
                 "background_color": ("STRING", {"default": "#FFFFFF"}),
                 "text_color": ("STRING", {"default": "#000000"}),
                 "text_margin": ("INT", {"default": 10, "min": 0, "max": 200, "step": 5}),
@@ -126,6 +203,9 @@ class ImageFrame:
                 "label1": ("STRING", {"default": "图像1"}),
                 "label2": ("STRING", {"default": "图像2"}),
                 "label3": ("STRING", {"default": "图像3"}),
+                "backend": (["torch", "pil"], {"default": "torch"}),
+                "max_output_side": ("INT", {"default": 0, "min": 0, "max": 16384, "step": 64,
+                                            "tooltip": "输出长边上限，超出时图像在拼接前缩小，边框/标签区/字号按同一比例缩小 (0=联系表 4096，其他模式不限制)"}),
             }
         }
 
@@ -161,170 +241,89 @@ class ImageFrame:
 
     @classmethod
     def find_custom_fonts(cls):
-        """查找自定义字体文件 - 在 ComfyUI/custom_nodes/Comfyui-XingYue/fonts 中"""
-        custom_fonts = []
-        
-        # 获取当前脚本所在目录
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        # 主要字体目录：ComfyUI/custom_nodes/Comfyui-XingYue/fonts
-        main_font_dir = os.path.join(current_dir, 'fonts')
-        
-        # 备用字体目录（兼容旧路径）
-        backup_font_dirs = [
-            os.path.join(current_dir, '..', 'fonts'),
-            os.path.join(current_dir, '..', '..', 'fonts'),
-        ]
-        
-        # 支持的字体文件扩展名
-        extensions = ['.ttf', '.otf', '.ttc']
-        
-        # 首先检查主要字体目录
-        font_dirs_to_check = [main_font_dir] + backup_font_dirs
-        
-        for font_dir in font_dirs_to_check:
-            if not os.path.exists(font_dir):
-                continue
-                
-            try:
-                for file in os.listdir(font_dir):
-                    file_path = os.path.join(font_dir, file)
-                    if os.path.isfile(file_path) and any(file.lower().endswith(ext) for ext in extensions):
-                        # 使用文件名（不带扩展名）作为显示名称
-                        font_name = os.path.splitext(file)[0]
-                        if font_name not in custom_fonts:
-                            custom_fonts.append(font_name)
-                            print(f"✅ 找到自定义字体: {font_name} -> {file_path}")
-            except Exception as e:
-                print(f"⚠️ 扫描字体目录时出错 {font_dir}: {e}")
-        
-        print(f"🎯 共找到 {len(custom_fonts)} 个自定义字体")
-        return custom_fonts
-
-    def tensor_to_pil(self, img_tensor):
-        """将 ComfyUI 图像张量转换为 PIL 图像"""
-        if len(img_tensor.shape) == 4:  # Batch of images
-            batch_size, _, _, _ = img_tensor.shape
-            images = []
-            for i in range(batch_size):
-                img_np = 255. * img_tensor[i].cpu().numpy()
-                img = Image.fromarray(np.clip(img_np, 0, 255).astype(np.uint8))
-                images.append(img)
-            return images
-        else:
-            img_np = 255. * img_tensor.cpu().numpy()
-            return [Image.fromarray(np.clip(img_np, 0, 255).astype(np.uint8))]
-
-    def pil_to_tensor(self, pil_images):
-        """将 PIL 图像列表转换回 ComfyUI 图像张量"""
-        tensors = []
-        for img in pil_images:
-            img_np = np.array(img).astype(np.float32) / 255.0
-            tensor = torch.from_numpy(img_np)[None,]
-            tensors.append(tensor)
-        return torch.cat(tensors, dim=0)
+        """查找自定义字体文件（使用缓存的字体索引，目录 mtime 变化时自动更新）"""
+        return find_custom_fonts()
+
+    @classmethod
+    def refresh_fonts(cls):
+        """强制重新扫描字体目录，新加入的字体无需重启即可出现在选项中"""
+        return refresh_fonts()
 
     def find_font_file(self, font_name):
-        """根据字体名称查找字体文件 - 在 ComfyUI/custom_nodes/Comfyui-XingYue/fonts 中"""
-        # 获取当前脚本所在目录
-        current_dir = os.path.dirname(os.path.abspath(__file__))
+        """根据字体名称查找字体文件（使用进程级字体索引）"""
+        return find_font_file(font_name)
+
+    def get_font(self, font_size, font_selection="Arial"):
+        """加载字体 - 按照1自定义文件2系统文件的顺序（已加载的字体按 (路径, 字号) 缓存）"""
+        return get_font(font_size, font_selection)
+
+    def compute_layout(self, image_sizes, mode, footer_height, border_thickness):
+        """
+        计算画布尺寸、每张图像的位置和每个标签的位置（同一批次所有帧尺寸相同，整批只计算一次）
         
-        # 主要字体目录：ComfyUI/custom_nodes/Comfyui-XingYue/fonts
-        main_font_dir = os.path.join(current_dir, 'fonts')
+        Returns:
+            ((画布宽, 画布高), [图像左上角 (x, y)], [标签区域 (左边界, 宽度, 文字 y)，文字在区域内水平居中])
+        """
+        count = len(image_sizes)
+        positions = []
+        label_areas = []
         
-        # 备用字体目录（兼容旧路径）
-        backup_font_dirs = [
-            os.path.join(current_dir, '..', 'fonts'),
-            os.path.join(current_dir, '..', '..', 'fonts'),
-        ]
+        if mode == "horizontal" or (mode == "grid" and count <= 2):
+            # 水平排列（1-2张图）或网格模式下的1-2张图，标签在底部区域
+            total_width = sum(size[0] for size in image_sizes) + border_thickness * (count + 1)
+            total_height = max(size[1] for size in image_sizes) + border_thickness * 2 + footer_height
+            x_offset = border_thickness
+            for width, height in image_sizes:
+                positions.append((x_offset, border_thickness))
+                label_areas.append((x_offset, width, total_height - footer_height))
+                x_offset += width + border_thickness
         
-        # 支持的字体文件扩展名
-        extensions = ['.ttf', '.otf', '.ttc']
+        elif mode == "vertical" or (mode == "grid" and count == 1):
+            # 垂直排列（1-3张图）或网格模式下的1张图，标签在每张图下方
+            total_width = max(size[0] for size in image_sizes) + border_thickness * 2
+            total_height = sum(size[1] for size in image_sizes) + border_thickness * (count + 1) + footer_height
+            y_offset = border_thickness
+            for width, height in image_sizes:
+                positions.append((border_thickness, y_offset))
+                label_areas.append((0, total_width, y_offset + height))
+                y_offset += height + border_thickness
         
-        # 首先检查主要字体目录
-        font_dirs_to_check = [main_font_dir] + backup_font_dirs
+        else:  # grid mode with 3 images
+            # 网格模式排列3张图（2x2网格，但只使用3个位置），图像在格子中居中
+            max_width = max(size[0] for size in image_sizes)
+            max_height = max(size[1] for size in image_sizes)
+            total_width = max_width * 2 + border_thickness * 3
+            total_height = max_height * 2 + border_thickness * 3 + footer_height
+            grid_positions = [
+                (border_thickness, border_thickness),  # 左上
+                (max_width + border_thickness * 2, border_thickness),  # 右上
+                (border_thickness, max_height + border_thickness * 2),  # 左下
+            ]
+            for (x, y), (width, height) in zip(grid_positions, image_sizes):
+                positions.append((x + (max_width - width) // 2, y + (max_height - height) // 2))
+                label_areas.append((x, max_width, y + max_height))
         
-        # 在所有字体目录中搜索
-        for font_dir in font_dirs_to_check:
-            if not os.path.exists(font_dir):
-                continue
-                
-            for root, dirs, files in os.walk(font_dir):
-                for file in files:
-                    file_lower = file.lower()
-                    name_without_ext = os.path.splitext(file)[0]
-                    
-                    # 检查文件名是否匹配
-                    if (font_name.lower() == file_lower or 
-                        font_name.lower() == name_without_ext.lower()):
-                        font_path = os.path.join(root, file)
-                        if os.path.exists(font_path):
-                            return font_path
-        
-        return None
+        return (total_width, total_height), positions, label_areas
 
-    def get_font(self, font_size, font_selection="Arial"):
-        """加载字体 - 按照1自定义文件2系统文件的顺序"""
-        # 1. 首先尝试作为自定义字体文件加载
-        found_font_path = self.find_font_file(font_selection)
-        if found_font_path:
-            try:
-                custom_font = ImageFont.truetype(found_font_path, font_size)
-                print(f"✅ 使用自定义字体: {found_font_path}")
-                return custom_font
-            except Exception as e:
-                print(f"⚠️ 无法加载自定义字体文件 {found_font_path}: {e}")
-        
-        # 2. 如果自定义字体失败，尝试系统字体
-        try:
-            # 根据字体选择确定系统字体
-            font_mapping = {
-                "Arial": "arial.ttf",
-                "Arial Bold": "arialbd.ttf", 
-                "Arial Italic": "ariali.ttf",
-                "Arial Bold Italic": "arialbi.ttf",
-                "DejaVu Sans": "DejaVuSans.ttf",
-                "DejaVu Sans Bold": "DejaVuSans-Bold.ttf",
-                "DejaVu Sans Oblique": "DejaVuSans-Oblique.ttf",
-                "Liberation Sans": "LiberationSans-Regular.ttf",
-                "Liberation Sans Bold": "LiberationSans-Bold.ttf",
-                "Liberation Sans Italic": "LiberationSans-Italic.ttf"
-            }
-            
-            font_file = font_mapping.get(font_selection)
-            
-            if font_file:
-                try:
-                    system_font = ImageFont.truetype(font_file, font_size)
-                    print(f"✅ 使用系统字体: {font_file}")
-                    return system_font
-                except:
-                    pass
-            
-            # 如果映射失败，尝试直接加载常见字体
-            font_names = [
-                "arial.ttf", "arialbd.ttf", "ariali.ttf", "arialbi.ttf",
-                "DejaVuSans.ttf", "DejaVuSans-Bold.ttf", "DejaVuSans-Oblique.ttf",
-                "LiberationSans-Regular.ttf", "LiberationSans-Bold.ttf", "LiberationSans-Italic.ttf"
-            ]
-            
-            for font_name in font_names:
-                try:
-                    system_font = ImageFont.truetype(font_name, font_size)
-                    print(f"✅ 使用系统字体: {font_name}")
-                    return system_font
-                except:
-                    continue
-            
-            # 如果系统字体都失败，使用备用字体
-            print(f"⚠️ 无法加载系统字体，使用备用字体")
-            return ImageFont.load_default()
-            
-        except Exception as e:
-            print(f"⚠️ 字体加载失败: {e}, 使用备用字体")
-            return ImageFont.load_default()
+    def render_layer(self, canvas_size, label_areas, labels, font, bg_color, txt_color, text_margin, draw_labels):
+        """绘制背景和标签（标签不随帧变化，整批只绘制一次）"""
+        layer = Image.new("RGB", canvas_size, bg_color)
+        if draw_labels:
+            draw = ImageDraw.Draw(layer)
+            for (left, area_width, text_y), label in zip(label_areas, labels):
+                text_bbox = draw.textbbox((0, 0), label, font=font)
+                text_width = text_bbox[2] - text_bbox[0]
+                draw.text((left + (area_width - text_width) // 2, text_y + text_margin), label, font=font, fill=txt_color)
+        return layer
+
+    def to_rgb(self, image):
+        """将图像张量统一为 3 通道（RGBA 丢弃透明通道，灰度复制到三个通道）"""
+        channels = image.shape[-1]
+        if channels >= 3:
+            return image[..., :3]
+        return image[..., :1].expand(*image.shape[:-1], 3)
 
-    def create_image_frame(self, image_count, footer_height, font_size, border_thickness, mode, background_color, text_color, text_margin, font_selection, image1=None, image2=None, image3=None, label1="图像1", label2="图像2", label3="图像3"):
+    def create_image_frame(self, image_count, footer_height, font_size, border_thickness, mode, background_color, text_color, text_margin, font_selection, image1=None, image2=None, image3=None, label1="图像1", label2="图像2", label3="图像3", backend="torch", max_output_side=0):
         # 收集所有输入的图像
         input_images = []
         input_labels = [label1, label2, label3]
@@ -343,16 +342,10 @@ class ImageFrame:
             empty_tensor = torch.zeros((1, 512, 512, 3))
             return (empty_tensor,)
         
-        # 转换为 PIL 图像
-        pil_images_list = []
-        for i in range(actual_image_count):
-            pil_images = self.tensor_to_pil(input_images[i])
-            pil_images_list.append(pil_images)
+        images = [image if image.dim() == 4 else image.unsqueeze(0) for image in input_images[:actual_image_count]]
         
         # 确定批处理大小（取所有图像批次的最小值）
-        batch_size = min(len(images) for images in pil_images_list if len(images) > 0)
-        
-        processed_images = []
+        batch_size = min(image.shape[0] for image in images)
         
         # 解析颜色
         try:
@@ -365,117 +358,130 @@ class ImageFrame:
         except:
             txt_color = (0, 0, 0)  # 默认黑色
 
+        if mode == "contact_sheet":
+            # 联系表：所有输入的每一帧都作为一个缩略图
+            return (self.create_contact_sheet(images, input_labels[:actual_image_count], font_size, font_selection,
+                                              bg_color, txt_color, footer_height, border_thickness, text_margin,
+                                              max_output_side or self.CONTACT_SHEET_MAX_SIDE),)
+
+        # 布局、背景和标签整批只计算/绘制一次
+        image_sizes = [(image.shape[2], image.shape[1]) for image in images]
+        canvas_size, positions, label_areas = self.compute_layout(image_sizes, mode, footer_height, border_thickness)
+        if max_output_side > 0 and max(canvas_size) > max_output_side:
+            # 超出输出上限：图像尺寸、边框、标签区、字号和边距按同一比例缩小后重新计算布局（全分辨率画布不会被创建）
+            scale = max_output_side / max(canvas_size)
+            image_sizes = [(max(1, int(width * scale)), max(1, int(height * scale))) for width, height in image_sizes]
+            footer_height = int(footer_height * scale)
+            border_thickness = int(border_thickness * scale)
+            text_margin = int(text_margin * scale)
+            font_size = max(1, round(font_size * scale)) if font_size > 0 else 0
+            original_size = canvas_size
+            canvas_size, positions, label_areas = self.compute_layout(image_sizes, mode, footer_height, border_thickness)
+            print(f"🎯 输出尺寸 {original_size[0]}x{original_size[1]} 超出上限 {max_output_side}，"
+                  f"缩小到 {canvas_size[0]}x{canvas_size[1]}")
+
+        # 加载字体（按照1自定义文件2系统文件的顺序），整批只加载一次
+        font = self.get_font(font_size, font_selection)
+        layer = self.render_layer(canvas_size, label_areas, input_labels[:actual_image_count], font,
+                                  bg_color, txt_color, text_margin, footer_height > 0 and font_size > 0)
+
+        if backend == "pil":
+            images = [torch.cat([chunk for _, chunk in self.scale_frames(image[:batch_size], width, height)])
+                      for image, (width, height) in zip(images, image_sizes)]
+            return (self.composite_pil(layer, images, positions, batch_size),)
+
+        # 预分配整批输出：先广播复制背景层，再按切片（按块缩小后）写入每张图像
+        layer_tensor = torch.from_numpy(np.array(layer)).float().div_(255.0)
+        output_tensor = torch.empty((batch_size, canvas_size[1], canvas_size[0], 3), dtype=torch.float32)
+        output_tensor.copy_(layer_tensor.expand(batch_size, -1, -1, -1))
+        for image, (x, y), (width, height) in zip(images, positions, image_sizes):
+            for start, chunk in self.scale_frames(image[:batch_size], width, height):
+                output_tensor[start:start + chunk.shape[0], y:y + height, x:x + width, :] = chunk
+        return (output_tensor,)
+
+    def scale_frames(self, image, width, height):
+        """按块将帧统一为 3 通道并（抗锯齿双线性）缩放到 width x height，逐块产出 (起始帧序号, 块)"""
+        for start in range(0, image.shape[0], self.SCALE_CHUNK):
+            chunk = self.to_rgb(image[start:start + self.SCALE_CHUNK])
+            if chunk.shape[1:3] != (height, width):
+                chunk = torch.nn.functional.interpolate(chunk.movedim(-1, 1).float(), size=(height, width),
+                                                        mode="bilinear", align_corners=False,
+                                                        antialias=True).clamp_(0.0, 1.0).movedim(1, -1)
+            yield start, chunk
+
+    def compute_contact_sheet_layout(self, count, tile_size, footer_height, border_thickness, max_side):
+        """
+        计算联系表的行列数和缩放比例：行列数使画布接近正方形，缩略图、标签区和边框按同一比例缩小到画布长边不超过 max_side
+        
+        Returns:
+            (列数, 行数, 缩放比例)
+        """
+        tile_width, tile_height = tile_size
+        cols = max(1, min(count, math.ceil(math.sqrt(count * (tile_height + footer_height) / tile_width))))
+        rows = math.ceil(count / cols)
+        full_width = cols * tile_width + border_thickness * (cols + 1)
+        full_height = rows * (tile_height + footer_height) + border_thickness * (rows + 1)
+        return cols, rows, min(1.0, max_side / max(full_width, full_height))
+    
+    def create_contact_sheet(self, images, labels, font_size, font_selection, bg_color, txt_color, footer_height,
+                             border_thickness, text_margin, max_side):
+        """
+        将所有输入的每一帧排成联系表（单张输出）：缩略图分块批量抗锯齿缩小，直接写入预分配的画布，
+        标签为 "标签 #序号"，位于每个缩略图下方高度为 footer_height 的区域
+        """
+        count = sum(image.shape[0] for image in images)
+        tile_size = (max(image.shape[2] for image in images), max(image.shape[1] for image in images))
+        cols, rows, scale = self.compute_contact_sheet_layout(count, tile_size, footer_height, border_thickness, max_side)
+        if min(tile_size) * scale < 1:
+            # 缩略图不足 1 像素：去掉边框和标签区，按纯缩略图重新计算行列
+            footer_height = border_thickness = 0
+            cols, rows, scale = self.compute_contact_sheet_layout(count, tile_size, 0, 0, max_side)
+            if min(tile_size) * scale < 1:
+                raise ValueError(f"联系表帧数过多: {count} 张无法放入长边 {max_side} 的画布")
+        # 缩略图、标签区、边框、字号和文字边距按同一比例缩小（向下取整，画布不会超出 max_side）
+        thumb_width, thumb_height = int(tile_size[0] * scale), int(tile_size[1] * scale)
+        footer_height = int(footer_height * scale)
+        border_thickness = int(border_thickness * scale)
+        text_margin = int(text_margin * scale)
+        font_size = max(1, round(font_size * scale)) if font_size > 0 else 0
+        cell_height = thumb_height + footer_height
+        canvas_size = (cols * thumb_width + border_thickness * (cols + 1),
+                       rows * cell_height + border_thickness * (rows + 1))
+        
+        positions = [(border_thickness + (k % cols) * (thumb_width + border_thickness),
+                      border_thickness + (k // cols) * (cell_height + border_thickness)) for k in range(count)]
+        label_areas = [(x, thumb_width, y + thumb_height) for x, y in positions]
+        tile_labels = [f"{label} #{i}".strip() for image, label in zip(images, labels) for i in range(image.shape[0])]
+        draw_labels = footer_height > 0 and font_size > 0
+        font = self.get_font(font_size, font_selection) if draw_labels else None
+        layer = self.render_layer(canvas_size, label_areas, tile_labels, font, bg_color, txt_color, text_margin, draw_labels)
+        sheet = torch.from_numpy(np.array(layer)).float().div_(255.0).unsqueeze(0)
+        print(f"🎯 联系表: {count} 张, {cols}x{rows}, 缩略图 {thumb_width}x{thumb_height}, 输出 {canvas_size[0]}x{canvas_size[1]}")
+        
+        k = 0
+        for image in images:
+            height, width = image.shape[1:3]
+            scale = min(thumb_width / width, thumb_height / height)
+            fit_width = max(1, min(thumb_width, round(width * scale)))
+            fit_height = max(1, min(thumb_height, round(height * scale)))
+            offset_x, offset_y = (thumb_width - fit_width) // 2, (thumb_height - fit_height) // 2
+            for _, chunk in self.scale_frames(image, fit_width, fit_height):
+                for frame in chunk:
+                    x, y = positions[k]
+                    sheet[0, y + offset_y:y + offset_y + fit_height, x + offset_x:x + offset_x + fit_width] = frame
+                    k += 1
+        return sheet
+
+    def composite_pil(self, layer, images, positions, batch_size):
+        """PIL 参考实现：每帧复制背景层后粘贴图像"""
+        pil_images_list = [tensor_to_pil(image[:batch_size]) for image in images]
+        processed_images = []
         for batch_idx in range(batch_size):
-            images = []
-            image_sizes = []
-            
-            # 获取当前批次的所有图像
-            for i in range(actual_image_count):
-                img = pil_images_list[i][batch_idx].convert("RGB")
-                images.append(img)
-                image_sizes.append(img.size)
-            
-            # 加载字体（按照1自定义文件2系统文件的顺序）
-            font = self.get_font(font_size, font_selection)
-            
-            if mode == "horizontal" or (mode == "grid" and actual_image_count <= 2):
-                # 水平排列（1-2张图）或网格模式下的1-2张图
-                total_width = sum(size[0] for size in image_sizes) + border_thickness * (actual_image_count + 1)
-                total_height = max(size[1] for size in image_sizes) + border_thickness * 2 + footer_height
-                
-                # 创建画布
-                canvas = Image.new("RGB", (total_width, total_height), bg_color)
-                draw = ImageDraw.Draw(canvas)
-                
-                # 放置图像
-                x_offset = border_thickness
-                for i, img in enumerate(images):
-                    canvas.paste(img, (x_offset, border_thickness))
-                    
-                    # 添加标签
-                    if footer_height > 0 and font_size > 0:
-                        text_bbox = draw.textbbox((0, 0), input_labels[i], font=font)
-                        text_width = text_bbox[2] - text_bbox[0]
-                        text_x = x_offset + (image_sizes[i][0] - text_width) // 2
-                        text_y = total_height - footer_height + text_margin
-                        draw.text((text_x, text_y), input_labels[i], font=font, fill=txt_color)
-                    
-                    x_offset += image_sizes[i][0] + border_thickness
-                    
-            elif mode == "vertical" or (mode == "grid" and actual_image_count == 1):
-                # 垂直排列（1-3张图）或网格模式下的1张图
-                total_width = max(size[0] for size in image_sizes) + border_thickness * 2
-                total_height = sum(size[1] for size in image_sizes) + border_thickness * (actual_image_count + 1) + footer_height
-                
-                # 创建画布
-                canvas = Image.new("RGB", (total_width, total_height), bg_color)
-                draw = ImageDraw.Draw(canvas)
-                
-                # 放置图像
-                y_offset = border_thickness
-                for i, img in enumerate(images):
-                    canvas.paste(img, (border_thickness, y_offset))
-                    
-                    # 添加标签
-                    if footer_height > 0 and font_size > 0:
-                        text_bbox = draw.textbbox((0, 0), input_labels[i], font=font)
-                        text_width = text_bbox[2] - text_bbox[0]
-                        text_x = (total_width - text_width) // 2
-                        text_y = y_offset + image_sizes[i][1] + text_margin
-                        draw.text((text_x, text_y), input_labels[i], font=font, fill=txt_color)
-                    
-                    y_offset += image_sizes[i][1] + border_thickness
-                    
-            else:  # grid mode with 3 images
-                # 网格模式排列3张图（2x2网格，但只使用3个位置）
-                max_width = max(size[0] for size in image_sizes)
-                max_height = max(size[1] for size in image_sizes)
-                
-                total_width = max_width * 2 + border_thickness * 3
-                total_height = max_height * 2 + border_thickness * 3 + footer_height
-                
-                # 创建画布
-                canvas = Image.new("RGB", (total_width, total_height), bg_color)
-                draw = ImageDraw.Draw(canvas)
-                
-                # 定义网格位置
-                grid_positions = [
-                    (border_thickness, border_thickness),  # 左上
-                    (max_width + border_thickness * 2, border_thickness),  # 右上
-                    (border_thickness, max_height + border_thickness * 2),  # 左下
-                ]
-                
-                # 放置图像
-                for i, img in enumerate(images):
-                    if i < 3:  # 确保不超过3张图
-                        x, y = grid_positions[i]
-                        # 居中放置图像
-                        img_x = x + (max_width - image_sizes[i][0]) // 2
-                        img_y = y + (max_height - image_sizes[i][1]) // 2
-                        canvas.paste(img, (img_x, img_y))
-                        
-                        # 添加标签
-                        if footer_height > 0 and font_size > 0:
-                            text_bbox = draw.textbbox((0, 0), input_labels[i], font=font)
-                            text_width = text_bbox[2] - text_bbox[0]
-                            
-                            if i == 0:  # 左上
-                                text_x = x + (max_width - text_width) // 2
-                                text_y = y + max_height + text_margin
-                            elif i == 1:  # 右上
-                                text_x = x + (max_width - text_width) // 2
-                                text_y = y + max_height + text_margin
-                            else:  # 左下
-                                text_x = x + (max_width - text_width) // 2
-                                text_y = y + max_height + text_margin
-                            
-                            draw.text((text_x, text_y), input_labels[i], font=font, fill=txt_color)
-            
+            canvas = layer.copy()
+            for pil_images, position in zip(pil_images_list, positions):
+                canvas.paste(pil_images[batch_idx].convert("RGB"), position)
             processed_images.append(canvas)
-        
-        # 转换回张量
-        output_tensor = self.pil_to_tensor(processed_images)
-        return (output_tensor,)
+        return pil_to_tensor(processed_images)
 
 class Resize:
     """
@@ -495,6 +501,9 @@ class Resize:
             },
             "optional": {
                 "mask": ("MASK",),
+                "backend": (["torch", "pil"], {"default": "torch"}),
+                "num_workers": ("INT", {"default": 1, "min": 0, "max": 64, "step": 1,
+                                        "tooltip": "PIL 后端逐帧并行线程数 (1=串行, 0=自动)，使用 kktools 共享线程池；torch 后端忽略"}),
             }
         }
 
@@ -503,64 +512,118 @@ class Resize:
     FUNCTION = "resize_both"
     CATEGORY = "kktools/Image"
 
-    def tensor_to_pil(self, img_tensor):
-        """将 ComfyUI 图像张量转换为 PIL 图像"""
-        if len(img_tensor.shape) == 4:  # Batch of images
-            batch_size, _, _, _ = img_tensor.shape
-            images = []
-            for i in range(batch_size):
-                img_np = 255. * img_tensor[i].cpu().numpy()
-                img = Image.fromarray(np.clip(img_np, 0, 255).astype(np.uint8))
-                images.append(img)
-            return images
-        else:
-            img_np = 255. * img_tensor.cpu().numpy()
-            return [Image.fromarray(np.clip(img_np, 0, 255).astype(np.uint8))]
+    def compute_geometry(self, img_width, img_height, width, height, resize_mode):
+        """
+        计算目标几何尺寸（整批只计算一次）
+        
+        Returns:
+            (缩放宽度, 缩放高度, 裁剪位置 (left, top) 或 None, 填充位置 (left, top) 或 None)
+        """
+        img_ratio = img_width / img_height
+        target_ratio = width / height
+        crop = None
+        pad = None
 
-    def mask_to_pil(self, mask_tensor):
-        """将蒙版张量转换为 PIL 图像"""
-        if mask_tensor is None:
-            return None
-            
-        if len(mask_tensor.shape) == 4:  # Batch of masks
-            batch_size, _, _, _ = mask_tensor.shape
-            masks = []
-            for i in range(batch_size):
-                mask_np = mask_tensor[i].cpu().numpy() * 255.0
-                mask = Image.fromarray(np.clip(mask_np, 0, 255).astype(np.uint8))
-                masks.append(mask)
-            return masks
-        else:
-            mask_np = mask_tensor.cpu().numpy() * 255.0
-            return [Image.fromarray(np.clip(mask_np, 0, 255).astype(np.uint8))]
-
-    def pil_to_tensor(self, pil_images):
-        """将 PIL 图像列表转换回 ComfyUI 图像张量"""
-        tensors = []
-        for img in pil_images:
-            img_np = np.array(img).astype(np.float32) / 255.0
-            tensor = torch.from_numpy(img_np)[None,]
-            tensors.append(tensor)
-        return torch.cat(tensors, dim=0)
-
-    def pil_to_mask(self, pil_masks):
-        """将 PIL 蒙版列表转换回 ComfyUI 蒙版张量"""
-        if pil_masks is None:
-            return None
-            
-        tensors = []
-        for mask in pil_masks:
-            mask_np = np.array(mask).astype(np.float32) / 255.0
-            tensor = torch.from_numpy(mask_np)[None,]
-            tensors.append(tensor)
-        return torch.cat(tensors, dim=0)
-
-    def resize_both(self, image, width, height, resize_mode, interpolation, mask=None):
+        if resize_mode == "stretch":
+            # 直接拉伸到目标尺寸
+            new_width, new_height = width, height
+        elif resize_mode == "scale_width" or (resize_mode == "scale_long" and img_ratio > target_ratio) \
+                or (resize_mode == "scale_short" and img_ratio <= target_ratio):
+            # 按宽度等比缩放
+            new_width, new_height = width, int(img_height * (width / img_width))
+        elif resize_mode in ("scale_height", "scale_long", "scale_short"):
+            # 按高度等比缩放
+            new_width, new_height = int(img_width * (height / img_height)), height
+        elif resize_mode == "fit_padding":
+            # 等比缩放并填充到目标尺寸
+            if img_ratio > target_ratio:
+                new_width, new_height = width, int(width / img_ratio)
+                pad = (0, (height - new_height) // 2)
+            else:
+                new_width, new_height = int(height * img_ratio), height
+                pad = ((width - new_width) // 2, 0)
+        else:  # fill_crop
+            # 等比缩放并裁剪到目标尺寸
+            if img_ratio > target_ratio:
+                new_width, new_height = int(height * img_ratio), height
+                crop = ((new_width - width) // 2, 0)
+            else:
+                new_width, new_height = width, int(width / img_ratio)
+                crop = (0, (new_height - height) // 2)
+
+        return max(1, new_width), max(1, new_height), crop, pad
+
+    def resize_both(self, image, width, height, resize_mode, interpolation, mask=None, backend="torch", num_workers=1):
+        if backend == "pil":
+            return self.resize_both_pil(image, width, height, resize_mode, interpolation, mask, num_workers)
+
+        # 确定批处理大小
+        batch_size = image.shape[0]
+        if mask is not None:
+            mask = normalize_mask(mask)
+            batch_size = min(batch_size, mask.shape[0])
+
+        if batch_size == 0:
+            # 如果没有输入，返回空张量
+            return (torch.zeros((1, height, width, 3)), torch.zeros((1, height, width)))
+
+        # 计算目标几何尺寸
+        img_height, img_width = image.shape[1], image.shape[2]
+        new_width, new_height, crop, pad = self.compute_geometry(img_width, img_height, width, height, resize_mode)
+
+        # 整批图像一次插值 (B, H, W, C) -> (B, C, H, W)
+        images = image[:batch_size, :, :, :3].float().movedim(-1, 1)
+        resized_image = self.interpolate(images, new_width, new_height, interpolation).movedim(1, -1)
+
+        # 蒙版始终使用最近邻插值
+        resized_mask = None
+        if mask is not None:
+            masks = mask[:batch_size].float().unsqueeze(1)
+            resized_mask = self.interpolate(masks, new_width, new_height, "nearest")[:, 0]
+
+        if crop is not None:
+            # 居中裁剪（张量切片）
+            left, top = crop
+            resized_image = resized_image[:, top:top + height, left:left + width, :]
+            if resized_mask is not None:
+                resized_mask = resized_mask[:, top:top + height, left:left + width]
+        elif pad is not None:
+            # 居中填充（写入预分配的黑色画布）
+            left, top = pad
+            canvas = resized_image.new_zeros((batch_size, height, width, resized_image.shape[-1]))
+            canvas[:, top:top + new_height, left:left + new_width, :] = resized_image
+            resized_image = canvas
+            if resized_mask is not None:
+                mask_canvas = resized_mask.new_zeros((batch_size, height, width))
+                mask_canvas[:, top:top + new_height, left:left + new_width] = resized_mask
+                resized_mask = mask_canvas
+
+        # 如果没有蒙版输入，返回空的蒙版张量
+        if resized_mask is None:
+            resized_mask = torch.zeros((batch_size, resized_image.shape[1], resized_image.shape[2]))
+
+        return (resized_image.contiguous(), resized_mask.contiguous())
+
+    def interpolate(self, tensor, new_width, new_height, interpolation):
+        """对 (B, C, H, W) 张量进行插值，缩小时启用抗锯齿（torch 没有 lanczos，使用抗锯齿的 bicubic 代替）"""
+        in_height, in_width = tensor.shape[-2:]
+        if (in_height, in_width) == (new_height, new_width):
+            return tensor
+        if interpolation == "nearest":
+            return torch.nn.functional.interpolate(tensor, size=(new_height, new_width), mode="nearest-exact")
+        mode = "bilinear" if interpolation == "bilinear" else "bicubic"
+        downscale = new_height < in_height or new_width < in_width
+        resized = torch.nn.functional.interpolate(tensor, size=(new_height, new_width), mode=mode,
+                                                  align_corners=False, antialias=downscale)
+        return resized.clamp_(0.0, 1.0)
+
+    def resize_both_pil(self, image, width, height, resize_mode, interpolation, mask=None, num_workers=1):
+        """PIL 参考实现（逐帧缩放，用于与旧版本逐像素对齐），num_workers > 1 时各帧在共享线程池中并行处理"""
         # 转换为 PIL 图像
-        pil_images = self.tensor_to_pil(image)
+        pil_images = tensor_to_pil(image)
         
         # 转换为 PIL 蒙版（如果存在）
-        pil_masks = self.mask_to_pil(mask) if mask is not None else None
+        pil_masks = mask_to_pil(mask) if mask is not None else None
         
         # 确定批处理大小
         batch_size = len(pil_images)
@@ -569,9 +632,7 @@ class Resize:
         
         if batch_size == 0:
             # 如果没有输入，返回空张量
-            empty_image = torch.zeros((1, height, width, 3))
-            empty_mask = torch.zeros((1, height, width, 1)) if mask is not None else None
-            return (empty_image, empty_mask) if empty_mask is not None else (empty_image,)
+            return (torch.zeros((1, height, width, 3)), torch.zeros((1, height, width)))
         
         # 设置插值方法
         interpolation_map = {
@@ -582,156 +643,53 @@ class Resize:
         }
         interp_method = interpolation_map.get(interpolation, Image.Resampling.LANCZOS)
         
-        resized_images = []
-        resized_masks = [] if pil_masks is not None else None
+        # 同一批次所有帧尺寸相同：预分配整批输出，每帧写入自己的位置
+        new_width, new_height, crop, pad = self.compute_geometry(pil_images[0].width, pil_images[0].height,
+                                                                 width, height, resize_mode)
+        out_height, out_width = (new_height, new_width) if crop is None and pad is None else (height, width)
+        output_image = torch.empty((batch_size, out_height, out_width, 3), dtype=torch.float32)
+        output_mask = torch.empty((batch_size, out_height, out_width), dtype=torch.float32) if pil_masks is not None else None
+        image_np = output_image.numpy()
+        mask_np = output_mask.numpy() if output_mask is not None else None
         
-        for batch_idx in range(batch_size):
+        def process(batch_idx):
             img = pil_images[batch_idx].convert("RGB")
             msk = pil_masks[batch_idx].convert("L") if pil_masks is not None else None
             
-            if resize_mode == "stretch":
-                # 直接拉伸到目标尺寸
-                resized_img = img.resize((width, height), interp_method)
-                if msk is not None:
-                    resized_mask = msk.resize((width, height), Image.Resampling.NEAREST)
-                
-            elif resize_mode == "scale_width":
-                # 按宽度等比缩放
-                scale_factor = width / img.width
-                new_height = int(img.height * scale_factor)
-                resized_img = img.resize((width, new_height), interp_method)
+            resized_img = img.resize((new_width, new_height), interp_method)
+            if msk is not None:
+                resized_mask = msk.resize((new_width, new_height), Image.Resampling.NEAREST)
+            
+            if crop is not None:
+                # 居中裁剪
+                left, top = crop
+                resized_img = resized_img.crop((left, top, left + width, top + height))
                 if msk is not None:
-                    resized_mask = msk.resize((width, new_height), Image.Resampling.NEAREST)
-                
-            elif resize_mode == "scale_height":
-                # 按高度等比缩放
-                scale_factor = height / img.height
-                new_width = int(img.width * scale_factor)
-                resized_img = img.resize((new_width, height), interp_method)
+                    resized_mask = resized_mask.crop((left, top, left + width, top + height))
+            elif pad is not None:
+                # 创建填充画布
+                canvas = Image.new("RGB", (width, height), (0, 0, 0))
+                canvas.paste(resized_img, pad)
+                resized_img = canvas
                 if msk is not None:
-                    resized_mask = msk.resize((new_width, height), Image.Resampling.NEAREST)
-                
-            elif resize_mode == "scale_long":
-                # 按长边等比缩放
-                img_ratio = img.width / img.height
-                target_ratio = width / height
-                
-                if img_ratio > target_ratio:
-                    # 图像较宽，按宽度缩放
-                    scale_factor = width / img.width
-                    new_height = int(img.height * scale_factor)
-                    resized_img = img.resize((width, new_height), interp_method)
-                    if msk is not None:
-                        resized_mask = msk.resize((width, new_height), Image.Resampling.NEAREST)
-                else:
-                    # 图像较高，按高度缩放
-                    scale_factor = height / img.height
-                    new_width = int(img.width * scale_factor)
-                    resized_img = img.resize((new_width, height), interp_method)
-                    if msk is not None:
-                        resized_mask = msk.resize((new_width, height), Image.Resampling.NEAREST)
-                
-            elif resize_mode == "scale_short":
-                # 按短边等比缩放
-                img_ratio = img.width / img.height
-                target_ratio = width / height
-                
-                if img_ratio > target_ratio:
-                    # 图像较宽，按高度缩放
-                    scale_factor = height / img.height
-                    new_width = int(img.width * scale_factor)
-                    resized_img = img.resize((new_width, height), interp_method)
-                    if msk is not None:
-                        resized_mask = msk.resize((new_width, height), Image.Resampling.NEAREST)
-                else:
-                    # 图像较高，按宽度缩放
-                    scale_factor = width / img.width
-                    new_height = int(img.height * scale_factor)
-                    resized_img = img.resize((width, new_height), interp_method)
-                    if msk is not None:
-                        resized_mask = msk.resize((width, new_height), Image.Resampling.NEAREST)
-                
-            elif resize_mode == "fit_padding":
-                # 等比缩放并填充到目标尺寸
-                img_ratio = img.width / img.height
-                target_ratio = width / height
-                
-                if img_ratio > target_ratio:
-                    # 图像较宽，填充高度
-                    new_height = int(width / img_ratio)
-                    resized_img = img.resize((width, new_height), interp_method)
-                    
-                    # 创建填充画布
-                    canvas = Image.new("RGB", (width, height), (0, 0, 0))
-                    pad_top = (height - new_height) // 2
-                    canvas.paste(resized_img, (0, pad_top))
-                    resized_img = canvas
-                    
-                    if msk is not None:
-                        resized_mask = msk.resize((width, new_height), Image.Resampling.NEAREST)
-                        mask_canvas = Image.new("L", (width, height), 0)
-                        mask_canvas.paste(resized_mask, (0, pad_top))
-                        resized_mask = mask_canvas
-                else:
-                    # 图像较高，填充宽度
-                    new_width = int(height * img_ratio)
-                    resized_img = img.resize((new_width, height), interp_method)
-                    
-                    # 创建填充画布
-                    canvas = Image.new("RGB", (width, height), (0, 0, 0))
-                    pad_left = (width - new_width) // 2
-                    canvas.paste(resized_img, (pad_left, 0))
-                    resized_img = canvas
-                    
-                    if msk is not None:
-                        resized_mask = msk.resize((new_width, height), Image.Resampling.NEAREST)
-                        mask_canvas = Image.new("L", (width, height), 0)
-                        mask_canvas.paste(resized_mask, (pad_left, 0))
-                        resized_mask = mask_canvas
-                
-            else:  # fill_crop
-                # 等比缩放并裁剪到目标尺寸
-                img_ratio = img.width / img.height
-                target_ratio = width / height
-                
-                if img_ratio > target_ratio:
-                    # 图像较宽，裁剪宽度
-                    new_height = height
-                    new_width = int(height * img_ratio)
-                    resized_img = img.resize((new_width, new_height), interp_method)
-                    
-                    # 居中裁剪
-                    left = (new_width - width) // 2
-                    resized_img = resized_img.crop((left, 0, left + width, height))
-                    
-                    if msk is not None:
-                        resized_mask = msk.resize((new_width, new_height), Image.Resampling.NEAREST)
-                        resized_mask = resized_mask.crop((left, 0, left + width, height))
-                else:
-                    # 图像较高，裁剪高度
-                    new_width = width
-                    new_height = int(width / img_ratio)
-                    resized_img = img.resize((new_width, new_height), interp_method)
-                    
-                    # 居中裁剪
-                    top = (new_height - height) // 2
-                    resized_img = resized_img.crop((0, top, width, top + height))
-                    
-                    if msk is not None:
-                        resized_mask = msk.resize((new_width, new_height), Image.Resampling.NEAREST)
-                        resized_mask = resized_mask.crop((0, top, width, top + height))
+                    mask_canvas = Image.new("L", (width, height), 0)
+                    mask_canvas.paste(resized_mask, pad)
+                    resized_mask = mask_canvas
             
-            resized_images.append(resized_img)
-            if msk is not None and resized_masks is not None:
-                resized_masks.append(resized_mask)
+            image_np[batch_idx] = np.asarray(resized_img)
+            if msk is not None:
+                mask_np[batch_idx] = np.asarray(resized_mask)
+        
+        run_parallel(process, range(batch_size), resolve_workers(num_workers, batch_size))
         
-        # 转换回张量
-        output_image = self.pil_to_tensor(resized_images)
-        output_mask = self.pil_to_mask(resized_masks) if resized_masks is not None else None
+        # 整批一次归一化
+        output_image.div_(255.0)
+        if output_mask is not None:
+            output_mask.div_(255.0)
         
         # 如果没有蒙版输入，返回空的蒙版张量
         if output_mask is None:
-            output_mask = torch.zeros((batch_size, height, width, 1))
+            output_mask = torch.zeros((batch_size, output_image.shape[1], output_image.shape[2]))
         
         return (output_image, output_mask)
 
@@ -770,7 +728,7 @@ class BatchImageLoader:
                 "directory": ("STRING", {
                     "default": "",
                     "multiline": False,
-                    "placeholder": "输入图像文件夹路径"
+                    "placeholder": "输入图像文件夹路径或 tar/zip 分片路径"
                 }),
                 "load_order": (["sequential", "reverse", "random"], {
                     "default": "sequential"
@@ -814,20 +772,96 @@ class BatchImageLoader:
                     "max": 9999,
                     "step": 1
                 }),
+                "num_workers": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 64,
+                    "step": 1,
+                    "tooltip": "并行解码线程数 (0=自动, 1=串行)"
+                }),
+                "on_error": (["skip", "stop"], {
+                    "default": "skip",
+                    "tooltip": "单个文件加载失败时: skip=跳过并记录日志, stop=整批失败"
+                }),
+                "max_side": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 16384,
+                    "step": 8,
+                    "tooltip": "解码时将长边缩小到该尺寸 (0=原始分辨率)，JPEG 使用 draft 模式按 2 的幂缩小解码"
+                }),
+                "cache_mode": (["off", "memory", "memory+disk"], {
+                    "default": "off",
+                    "tooltip": "跨执行复用解码结果: memory=进程内 LRU 缓存, memory+disk=另存为内存映射 .npy 文件"
+                }),
+                "batch_mode": (["standard", "cursor", "watch"], {
+                    "default": "standard",
+                    "tooltip": "cursor=每次执行返回下一组 max_images 张图像，位置按 (目录, 扩展名/顺序/间隔/起始/种子/分桶) 持久化，后台预解码下一组; "
+                               "watch=只返回上次执行后新增的文件，已处理文件记录在持久化账本中"
+                }),
+                "bucket_mode": (["off", "resolution", "aspect"], {
+                    "default": "off",
+                    "tooltip": "按图像头分组: resolution=相同分辨率, aspect=相近宽高比；每次执行输出一个桶 (batch_index 或游标选择)"
+                }),
+                "bucket_fit": (["pad", "resize"], {
+                    "default": "pad",
+                    "tooltip": "aspect 分桶时尺寸不同的图像: pad=等比缩放后居中填充 (蒙版标记有效区域), resize=直接缩放到桶尺寸"
+                }),
+                "caption_extension": (["off", "txt", "caption"], {
+                    "default": "off",
+                    "tooltip": "读取与图像同名的字幕文件 (img_001.png -> img_001.txt)，按图像顺序输出到 captions 列表"
+                }),
+                "load_metadata": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "读取与图像同名的 .json 元数据文件，按图像顺序输出到 metadata 列表"
+                }),
+                "min_width": ("INT", {"default": 0, "min": 0, "max": 65536, "step": 1,
+                                      "tooltip": "只读取图像头筛选，0=不限制 (按 EXIF 方向校正后的原始尺寸)"}),
+                "max_width": ("INT", {"default": 0, "min": 0, "max": 65536, "step": 1}),
+                "min_height": ("INT", {"default": 0, "min": 0, "max": 65536, "step": 1}),
+                "max_height": ("INT", {"default": 0, "min": 0, "max": 65536, "step": 1}),
+                "min_aspect": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 100.0, "step": 0.01,
+                                         "tooltip": "宽高比 (宽/高) 下限，0=不限制"}),
+                "max_aspect": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 100.0, "step": 0.01}),
+                "image_mode": (["any", "RGB", "RGBA", "L", "LA", "P", "CMYK"], {
+                    "default": "any",
+                    "tooltip": "按文件中的颜色模式筛选"
+                }),
+                "min_file_kb": ("INT", {"default": 0, "min": 0, "max": 10485760, "step": 1,
+                                        "tooltip": "按文件大小筛选 (KB)，使用目录扫描结果，不打开文件"}),
+                "max_file_kb": ("INT", {"default": 0, "min": 0, "max": 10485760, "step": 1}),
+                "exif_orientation": ("BOOLEAN", {
+                    "default": True,
+                    "tooltip": "按 EXIF 方向旋转/翻转图像"
+                }),
+                "mask_source": (["none", "alpha"], {
+                    "default": "none",
+                    "tooltip": "alpha=在同一次解码中输出透明通道作为蒙版 (不透明=1，没有透明通道的图像为 1)"
+                }),
+                "invert_mask": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "反转透明通道蒙版 (透明=1，与 ComfyUI Load Image 的蒙版一致)"
+                }),
             }
         }
     
-    RETURN_TYPES = ("IMAGE", "MASK", "INT", "STRING")
-    RETURN_NAMES = ("images", "masks", "loaded_count", "file_info")
+    RETURN_TYPES = ("IMAGE", "MASK", "INT", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("images", "masks", "loaded_count", "file_info", "captions", "metadata")
+    OUTPUT_IS_LIST = (False, False, False, False, True, True)
     FUNCTION = "load_images"
     CATEGORY = "kktools/Image"
     
-    def load_images(self, directory, load_order, load_interval, start_index, max_images, file_extensions, seed, batch_index=0):
+    def load_images(self, directory, load_order, load_interval, start_index, max_images, file_extensions, seed, batch_index=0,
+                    num_workers=0, on_error="skip", max_side=0, cache_mode="off", batch_mode="standard",
+                    bucket_mode="off", bucket_fit="pad", caption_extension="off", load_metadata=False,
+                    min_width=0, max_width=0, min_height=0, max_height=0, min_aspect=0.0, max_aspect=0.0,
+                    image_mode="any", min_file_kb=0, max_file_kb=0, exif_orientation=True,
+                    mask_source="none", invert_mask=False):
         """
         批量加载图像
         
         Args:
-            directory: 图像文件夹路径
+            directory: 图像文件夹路径（或 tar/zip 分片路径）
             load_order: 加载顺序 (sequential=顺序, reverse=倒序, random=随机)
             load_interval: 加载间隔 (每N张加载1张)
             start_index: 起始索引
@@ -835,9 +869,25 @@ class BatchImageLoader:
             file_extensions: 文件扩展名过滤
             seed: 随机种子 (用于随机排序)
             batch_index: 批次索引 (用于分批次加载)
+            num_workers: 并行解码线程数 (0=自动, 1=串行)
+            on_error: 单个文件加载失败时的处理方式 (skip=跳过, stop=整批失败)
+            max_side: 解码后的最大长边 (0=原始分辨率)
+            cache_mode: 解码缓存 (off=关闭, memory=进程内缓存, memory+disk=内存+磁盘缓存)
+            batch_mode: 批次模式 (standard=标准, cursor=游标流式读取, watch=只处理新文件)
+            bucket_mode: 分桶模式 (off=关闭, resolution=按分辨率, aspect=按宽高比)
+            bucket_fit: 桶内尺寸不一致时的处理方式 (pad=填充, resize=缩放)
+            caption_extension: 同名字幕文件扩展名 (off=不读取)
+            load_metadata: 是否读取同名 .json 元数据
+            min_width/max_width/min_height/max_height: 尺寸筛选 (0=不限制)
+            min_aspect/max_aspect: 宽高比筛选 (0=不限制)
+            image_mode: 颜色模式筛选 (any=不限制)
+            min_file_kb/max_file_kb: 文件大小筛选 (0=不限制)
+            exif_orientation: 是否按 EXIF 方向校正
+            mask_source: 蒙版来源 (none=全 1, alpha=透明通道)
+            invert_mask: 是否反转透明通道蒙版
             
         Returns:
-            (图像张量, 蒙版张量, 加载数量, 文件信息)
+            (图像张量, 蒙版张量, 加载数量, 文件信息, 字幕列表, 元数据 JSON 列表)
         """
         try:
             # 检查目录是否存在
@@ -846,107 +896,179 @@ class BatchImageLoader:
                 print(f"BatchImageLoader Error: {error_msg}")
                 empty_tensor = torch.zeros((1, 512, 512, 3))
                 empty_mask = torch.zeros((1, 512, 512, 1))
-                return (empty_tensor, empty_mask, 0, error_msg)
-            
-            # 获取支持的图像文件扩展名
-            extensions = self._get_supported_extensions(file_extensions)
-            
-            # 查找所有图像文件
-            image_files = []
-            for ext in extensions:
-                pattern = os.path.join(directory, f"*.{ext}")
-                image_files.extend(glob.glob(pattern))
+                return (empty_tensor, empty_mask, 0, error_msg, [""], ["{}"])
             
-            # 按文件名排序
-            image_files.sort()
+            # 从目录扫描索引（或分片成员索引）中筛选图像文件（已按文件名排序，目录/分片未变化时不重新扫描）
+            all_entries = self._scan_entries(directory, file_extensions)
             
-            if not image_files:
+            if not all_entries:
                 error_msg = f"在目录中未找到图像文件: {directory}"
                 print(f"BatchImageLoader Error: {error_msg}")
                 empty_tensor = torch.zeros((1, 512, 512, 3))
                 empty_mask = torch.zeros((1, 512, 512, 1))
-                return (empty_tensor, empty_mask, 0, error_msg)
+                return (empty_tensor, empty_mask, 0, error_msg, [""], ["{}"])
             
-            # 根据加载顺序调整文件列表
-            if load_order == "reverse":
-                image_files.reverse()
-            elif load_order == "random":
-                # 设置随机种子
-                if seed > 0:
-                    random.seed(seed)
-                random.shuffle(image_files)
-                print(f"🎲 使用随机种子 {seed} 打乱文件顺序")
+            # 透明通道蒙版：以 RGBA 解码一次，RGB 写入图像、A 写入蒙版
+            decode_options = {"mode": "RGBA" if mask_source == "alpha" else "RGB", "max_side": max_side,
+                              "cache_mode": cache_mode, "exif": exif_orientation}
             
-            # 应用起始索引
-            if start_index > 0:
-                image_files = image_files[start_index:]
+            if batch_mode == "watch":
+                # 监视模式：只处理账本中没有记录（或 mtime/大小已变化）且已写入完成的文件，忽略起始索引和间隔
+                ledger = get_ledger_store(os.path.abspath(directory))
+                # 已删除文件的记录从账本中移除（按未筛选扩展名的完整扫描，切换 file_extensions 不会丢失记录）
+                listing = scan_archive(directory) if is_archive(directory) else scan_directory(directory)
+                pruned = ledger.prune({entry.name for entry in listing})
+                if pruned:
+                    print(f"🧹 账本移除 {pruned} 个已删除文件的记录")
+                all_entries = self._pending_entries(all_entries, ledger)
+                start_index, load_interval = 0, 1
+                print(f"👀 监视模式: {len(all_entries)} 个新文件")
             
-            # 应用加载间隔
-            if load_interval > 1:
-                image_files = image_files[::load_interval]
+            # 按文件大小和图像头筛选（解码之前，不读取像素数据）
+            filters = {"min_width": min_width, "max_width": max_width, "min_height": min_height, "max_height": max_height,
+                       "min_aspect": min_aspect, "max_aspect": max_aspect, "image_mode": image_mode,
+                       "min_file_kb": min_file_kb, "max_file_kb": max_file_kb}
+            if any(value not in (0, 0.0, "any") for value in filters.values()):
+                total_before = len(all_entries)
+                all_entries, rejected = self._filter_entries(all_entries, filters, decode_options,
+                                                             self._resolve_workers(num_workers, len(all_entries)), on_error)
+                print(f"🔍 图像头筛选: {total_before} -> {len(all_entries)} 个文件")
+                if batch_mode == "watch" and rejected:
+                    # 不符合条件的新文件也记入账本，之后不再检查
+                    ledger.update({entry.name: [entry.mtime_ns, entry.size] for entry in rejected})
             
-            # 应用最大数量限制
-            if max_images > 0:
-                image_files = image_files[:max_images]
+            if batch_mode == "watch":
+                if not all_entries:
+                    error_msg = f"没有新文件: {directory}"
+                    print(f"BatchImageLoader Error: {error_msg}")
+                    empty_tensor = torch.zeros((1, 512, 512, 3))
+                    empty_mask = torch.zeros((1, 512, 512, 1))
+                    return (empty_tensor, empty_mask, 0, error_msg, [""], ["{}"])
             
-            # 分批次处理
-            total_files = len(image_files)
-            if batch_index > 0:
-                # 计算批次大小（简单分批次）
-                batch_size = max(1, total_files // (batch_index + 1))
-                start_idx = batch_index * batch_size
-                end_idx = min(start_idx + batch_size, total_files)
-                image_files = image_files[start_idx:end_idx]
-                print(f"📦 批次处理: 索引 {batch_index}, 范围 {start_idx}-{end_idx}")
+            next_files = None
+            next_options = decode_options
+            bucket_label = None
+            sample_seed = seed
+            if batch_mode == "cursor":
+                # 游标按 (目录, 参数签名) 保存，同一目录上参数不同的多个节点互不影响
+                cursor_key = self._cursor_key(directory, file_extensions, load_order, load_interval, start_index, seed,
+                                              bucket_mode)
+                if load_order == "random" and seed == 0:
+                    # 种子为 0 时每轮使用一个新种子，同一轮内的各批次无放回
+                    sample_seed = self._cursor_seed(cursor_key)
+            
+            if bucket_mode != "off":
+                # 分桶模式：只读取图像头，按分辨率/宽高比分组，每次执行输出一个同尺寸批次
+                positions = self._resolve_positions(len(all_entries), load_order, load_interval, start_index,
+                                                    0 if batch_mode == "cursor" else max_images, sample_seed)
+                selected = [all_entries[position] for position in positions]
+                buckets = self._group_buckets(selected, bucket_mode, decode_options,
+                                              self._resolve_workers(num_workers, len(selected)), on_error)
+                total_files = sum(len(files) for _, _, files in buckets)
+                if batch_mode == "cursor":
+                    # 游标按 (桶, 每组 max_images 张) 前进，max_images=0 时每次输出整个桶
+                    buckets = self._split_buckets(buckets, max_images)
+                    bucket_position = self._get_cursor(cursor_key) % max(1, len(buckets))
+                    next_position = (bucket_position + 1) % max(1, len(buckets))
+                    cursor, next_cursor = bucket_position, next_position
+                    if len(buckets) > 1:
+                        next_files, next_options = self._bucket_options(buckets[next_position], decode_options, bucket_fit)
+                    print(f"🔖 游标位置: 桶组 {bucket_position}/{len(buckets)}，下一次: {next_position}")
+                else:
+                    # 监视模式每次处理第一个桶，其余新文件留到下一次执行
+                    bucket_position = 0 if batch_mode == "watch" else batch_index
+                
+                if bucket_position < len(buckets):
+                    image_files, decode_options = self._bucket_options(buckets[bucket_position], decode_options, bucket_fit)
+                    bucket_label = f"{buckets[bucket_position][0]} ({bucket_position + 1}/{len(buckets)})"
+                    print(f"🪣 分桶: 共 {len(buckets)} 组，输出 {bucket_label}，{len(image_files)} 张")
+                else:
+                    print(f"⚠️ 批次索引 {bucket_position} 超出分桶数量 {len(buckets)}")
+                    image_files = []
+            else:
+                if batch_mode == "cursor":
+                    # 游标模式：从持久化位置取下一组 max_images 张（0 视为 1），到末尾后从头开始
+                    positions = self._resolve_positions(len(all_entries), load_order, load_interval, start_index, 0, sample_seed)
+                    total_files = len(positions)
+                    chunk_size = max_images if max_images > 0 else 1
+                    cursor = self._get_cursor(cursor_key) % max(1, total_files)
+                    next_cursor = cursor + chunk_size if cursor + chunk_size < total_files else 0
+                    next_files = [all_entries[position] for position in positions[next_cursor:next_cursor + chunk_size]]
+                    positions = positions[cursor:cursor + chunk_size]
+                    print(f"🔖 游标位置: {cursor}/{total_files}，下一次: {next_cursor}")
+                else:
+                    # 在索引位置上解析加载顺序、起始索引、间隔、数量和批次（range 切片不复制文件列表）
+                    positions = self._resolve_positions(len(all_entries), load_order, load_interval, start_index, max_images, seed)
+                    total_files = len(positions)
+                
+                # 分批次处理
+                if batch_index > 0 and batch_mode == "standard":
+                    # 计算批次大小（简单分批次）
+                    batch_size = max(1, total_files // (batch_index + 1))
+                    start_idx = batch_index * batch_size
+                    end_idx = min(start_idx + batch_size, total_files)
+                    positions = positions[start_idx:end_idx]
+                    print(f"📦 批次处理: 索引 {batch_index}, 范围 {start_idx}-{end_idx}")
+                
+                image_files = [all_entries[position] for position in positions]
+                if batch_mode == "watch":
+                    # 与第一个文件尺寸不同的新文件留到下一次执行，不会因为无法组成批次而一直卡住
+                    image_files = self._first_size_files(image_files, decode_options,
+                                                         self._resolve_workers(num_workers, len(image_files)))
             
             if not image_files:
                 error_msg = "没有符合条件的图像文件"
                 print(f"BatchImageLoader Error: {error_msg}")
                 empty_tensor = torch.zeros((1, 512, 512, 3))
                 empty_mask = torch.zeros((1, 512, 512, 1))
-                return (empty_tensor, empty_mask, 0, error_msg)
+                return (empty_tensor, empty_mask, 0, error_msg, [""], ["{}"])
             
-            # 加载图像
-            images = []
-            masks = []
-            loaded_files = []
+            # 加载图像（PIL 解码时释放 GIL，使用线程池并行解码，结果保持文件顺序）
+            workers = self._resolve_workers(num_workers, len(image_files))
+            if batch_mode == "cursor":
+                # 优先使用上一次执行在后台预解码的结果；本组处理完成（on_error=skip 跳过的文件也算已处理）后才前进游标，
+                # 加载中止时下一次执行重试同一组，然后预解码下一组
+                images_tensor, masks_tensor, loaded_files = self._take_prefetched(directory, cursor_key, image_files, workers,
+                                                                                  on_error, decode_options)
+                self._set_cursor(cursor_key, next_cursor, sample_seed)
+                if next_files:
+                    self._start_prefetch(directory, cursor_key, next_files, workers, on_error, next_options)
+            else:
+                # 切换到其他模式后，这个目录之前的预解码结果不会再被使用
+                self._drop_prefetched(directory)
+                images_tensor, masks_tensor, loaded_files = self._load_batch(image_files, workers, on_error, decode_options)
             
-            for file_path in image_files:
-                try:
-                    # 加载图像
-                    image = Image.open(file_path)
-                    image = image.convert("RGB")
-                    
-                    # 转换为numpy数组并归一化
-                    image_np = np.array(image).astype(np.float32) / 255.0
-                    image_tensor = torch.from_numpy(image_np)[None,]
-                    images.append(image_tensor)
-                    
-                    # 创建空的蒙版（与图像相同尺寸）
-                    mask_tensor = torch.ones((1, image_np.shape[0], image_np.shape[1], 1))
-                    masks.append(mask_tensor)
-                    
-                    loaded_files.append(os.path.basename(file_path))
-                    
-                    print(f"✅ 加载图像: {os.path.basename(file_path)} - 尺寸: {image.size}")
-                    
-                except Exception as e:
-                    print(f"⚠️ 加载图像失败 {file_path}: {e}")
-                    continue
+            if batch_mode == "watch":
+                # 本批文件（包括跳过的失败文件）记入账本，之后不再处理
+                ledger.update({entry.name: [entry.mtime_ns, entry.size] for entry in image_files})
             
-            if not images:
+            if images_tensor is None:
                 error_msg = "所有图像加载失败"
                 print(f"BatchImageLoader Error: {error_msg}")
                 empty_tensor = torch.zeros((1, 512, 512, 3))
                 empty_mask = torch.zeros((1, 512, 512, 1))
-                return (empty_tensor, empty_mask, 0, error_msg)
+                return (empty_tensor, empty_mask, 0, error_msg, [""], ["{}"])
             
-            # 合并所有图像张量
-            images_tensor = torch.cat(images, dim=0)
-            masks_tensor = torch.cat(masks, dim=0)
+            if masks_tensor is None:
+                # 蒙版恒为 1，使用扩展视图代替 B×H×W 的实际分配
+                masks_tensor = torch.ones((1, 1, 1, 1)).expand(images_tensor.shape[0], images_tensor.shape[1], images_tensor.shape[2], 1)
+            else:
+                if mask_source == "alpha" and invert_mask:
+                    masks_tensor.neg_().add_(1.0)
+                masks_tensor = masks_tensor.unsqueeze(-1)
+            
+            # 从同一份扫描索引读取同名字幕和元数据（与输出图像一一对应，没有时为空）
+            entries_by_name = {entry.name: entry for entry in image_files}
+            captions, metadata = self._load_sidecars(directory, [entries_by_name[name] for name in loaded_files],
+                                                     caption_extension, load_metadata, workers)
             
-            # 生成文件信息
+            # 生成文件信息（附带探测到的解码尺寸，来自图像头缓存）
             file_info = self._generate_file_info(loaded_files, total_files, load_order, load_interval, start_index, seed, batch_index)
+            file_info += f" | 尺寸: {self._describe_sizes([entries_by_name[name] for name in loaded_files], decode_options)}"
+            if bucket_label is not None:
+                file_info += f" | 分桶: {bucket_label}"
+            if batch_mode == "cursor":
+                file_info += f" | 游标: {cursor}/{len(buckets) if bucket_mode != 'off' else total_files}"
             
             # 打印调试信息
             print(f"BatchImageLoader:")
@@ -959,17 +1081,652 @@ class BatchImageLoader:
             print(f"  随机种子: {seed}")
             print(f"  批次索引: {batch_index}")
             print(f"  找到文件: {total_files} 个")
-            print(f"  实际加载: {len(images)} 个")
+            print(f"  实际加载: {len(loaded_files)} 个")
             print(f"  输出尺寸: {images_tensor.shape}")
             
-            return (images_tensor, masks_tensor, len(images), file_info)
+            return (images_tensor, masks_tensor, len(loaded_files), file_info, captions, metadata)
             
         except Exception as e:
             error_msg = f"批量加载图像时出错: {str(e)}"
             print(f"BatchImageLoader Error: {error_msg}")
             empty_tensor = torch.zeros((1, 512, 512, 3))
             empty_mask = torch.zeros((1, 512, 512, 1))
-            return (empty_tensor, empty_mask, 0, error_msg)
+            return (empty_tensor, empty_mask, 0, error_msg, [""], ["{}"])
+    
+    @classmethod
+    def IS_CHANGED(cls, directory, load_order, load_interval, start_index, max_images, file_extensions, seed,
+                   batch_mode="standard", bucket_mode="off", **kwargs):
+        """游标模式下返回当前游标位置，监视模式下返回待处理新文件的摘要，变化时 ComfyUI 会重新执行节点"""
+        if batch_mode == "watch" and directory:
+            return cls._watch_state(directory, file_extensions)
+        if batch_mode != "cursor" or not directory:
+            return ""
+        cursor_key = cls._cursor_key(directory, file_extensions, load_order, load_interval, start_index, seed, bucket_mode)
+        return f"cursor:{cls._get_cursor(cursor_key)}"
+    
+    # 每个目录最多保留的参数签名（游标）数量，超出时丢弃最久未使用的
+    CURSOR_SIGNATURES_PER_DIRECTORY = 4
+    
+    @staticmethod
+    def _cursor_key(directory, file_extensions, load_order, load_interval, start_index, seed, bucket_mode="off"):
+        """游标状态和预解码结果的键：(目录, 影响文件顺序的参数签名)，参数变化时使用新的游标，从头开始"""
+        return (os.path.abspath(directory), f"{file_extensions}|{load_order}|{load_interval}|{start_index}|{seed}|{bucket_mode}")
+    
+    @staticmethod
+    def _get_cursor_state(cursor_key):
+        directory, signature = cursor_key
+        return (CURSOR_STORE.get(directory) or {}).get(signature)
+    
+    @classmethod
+    def _get_cursor(cls, cursor_key):
+        state = cls._get_cursor_state(cursor_key)
+        return state.get("position", 0) if state else 0
+    
+    @classmethod
+    def _set_cursor(cls, cursor_key, position, seed=0):
+        # 状态文件按目录保存，值中只保留最近使用的几个参数签名，文件大小不随参数调整次数增长
+        directory, signature = cursor_key
+        states = dict(CURSOR_STORE.get(directory) or {})
+        states.pop(signature, None)
+        states[signature] = {"position": position, "seed": seed}
+        CURSOR_STORE.set(directory, dict(list(states.items())[-cls.CURSOR_SIGNATURES_PER_DIRECTORY:]))
+    
+    @classmethod
+    def _cursor_seed(cls, cursor_key):
+        """游标回到 0（新一轮）时生成新的随机种子，同一轮内沿用已保存的种子"""
+        state = cls._get_cursor_state(cursor_key)
+        if state and state.get("position", 0) > 0 and state.get("seed"):
+            return state["seed"]
+        return new_seed()
+    
+    # 两次执行间文件 mtime 至少经过该时间（秒）才视为写入完成
+    WATCH_SETTLE_SECONDS = 2.0
+    
+    # 监视模式下每个目录最近一次非空的待处理摘要
+    _watch_states = {}
+    
+    @classmethod
+    def _watch_state(cls, directory, file_extensions):
+        """待处理新文件的摘要；没有新文件时沿用上一次的值，避免处理完后再输出一次空结果"""
+        key = os.path.abspath(directory)
+        try:
+            loader = cls()
+            pending = loader._pending_entries(loader._scan_entries(directory, file_extensions), get_ledger_store(key))
+        except Exception:
+            return ""
+        if not pending:
+            return cls._watch_states.get(key, "watch:idle")
+        digest = hashlib.sha1(repr([(entry.name, entry.mtime_ns, entry.size) for entry in pending]).encode("utf-8"))
+        state = f"watch:{digest.hexdigest()}"
+        cls._watch_states[key] = state
+        return state
+    
+    def _scan_entries(self, directory, file_extensions):
+        """获取目录（或分片）中符合扩展名的文件索引"""
+        extensions = self._get_supported_extensions(file_extensions)
+        if is_archive(directory):
+            return filter_by_extensions(scan_archive(directory), extensions)
+        return filter_by_extensions(scan_directory(directory), extensions)
+    
+    def _pending_entries(self, entries, ledger):
+        """账本中没有记录或 mtime/大小已变化、且已写入完成的文件（只对这些文件重新 stat，保持文件顺序）"""
+        settled_before = time.time_ns() - int(self.WATCH_SETTLE_SECONDS * 1e9)
+        pending = []
+        for entry in entries:
+            record = ledger.get(entry.name)
+            if record == [entry.mtime_ns, entry.size]:
+                continue
+            if entry.archive is None:
+                # 扫描索引按目录 mtime 缓存，原地写入中的文件需要重新获取大小和修改时间
+                try:
+                    entry = refresh_entry(entry)
+                except OSError:
+                    continue
+                if record == [entry.mtime_ns, entry.size]:
+                    continue
+                if entry.mtime_ns > settled_before:
+                    continue
+            pending.append(entry)
+        return pending
+    
+    # 后台预解码：每个目录最多保留一组 (游标键, 文件签名, Future)，参数变化后旧的预解码结果随即被替换或丢弃
+    _prefetch_lock = threading.Lock()
+    _prefetch_executor = None
+    _prefetched = {}
+    
+    def _prefetch_signature(self, image_files, on_error, options):
+        return (tuple(self._file_stamp(entry) for entry in image_files), on_error, tuple(sorted(options.items())))
+    
+    def _file_stamp(self, entry):
+        """文件的 (路径, mtime, 大小)，目录文件重新 stat（预解码之后被覆盖的文件不会使用旧结果）"""
+        try:
+            entry = refresh_entry(entry)
+        except OSError:
+            pass
+        return (entry.path, entry.mtime_ns, entry.size)
+    
+    def _start_prefetch(self, directory, cursor_key, image_files, workers, on_error, options):
+        """在后台线程中解码下一组图像，与下游节点的处理重叠；替换（并尽量取消）该目录之前的预解码"""
+        cls = type(self)
+        signature = self._prefetch_signature(image_files, on_error, options)
+        with cls._prefetch_lock:
+            if cls._prefetch_executor is None:
+                cls._prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kktools-prefetch")
+            future = cls._prefetch_executor.submit(self._load_batch, image_files, workers, on_error, dict(options))
+            previous = cls._prefetched.get(os.path.abspath(directory))
+            cls._prefetched[os.path.abspath(directory)] = (cursor_key, signature, future)
+        if previous is not None:
+            previous[2].cancel()
+    
+    def _drop_prefetched(self, directory):
+        """丢弃（并尽量取消）目录的预解码结果"""
+        cls = type(self)
+        with cls._prefetch_lock:
+            prefetched = cls._prefetched.pop(os.path.abspath(directory), None)
+        if prefetched is not None:
+            prefetched[2].cancel()
+    
+    def _take_prefetched(self, directory, cursor_key, image_files, workers, on_error, options):
+        """取出与本次游标和文件一致的预解码结果（不一致的结果直接丢弃），没有或失败时同步解码"""
+        cls = type(self)
+        with cls._prefetch_lock:
+            prefetched = cls._prefetched.pop(os.path.abspath(directory), None)
+        if prefetched is not None and (prefetched[0], prefetched[1]) != (
+                cursor_key, self._prefetch_signature(image_files, on_error, options)):
+            prefetched[2].cancel()
+            prefetched = None
+        if prefetched is not None:
+            try:
+                result = prefetched[2].result()
+                print(f"⚡ 使用后台预解码结果: {len(result[2])} 张")
+                return result
+            except Exception as e:
+                print(f"⚠️ 后台预解码失败，重新解码: {e}")
+        return self._load_batch(image_files, workers, on_error, options)
+    
+    # aspect 分桶的标准宽高比（按对数距离取最近的一个）
+    ASPECT_BUCKETS = [(1, 3), (1, 2), (9, 16), (2, 3), (3, 4), (4, 5), (1, 1),
+                      (5, 4), (4, 3), (3, 2), (16, 9), (2, 1), (3, 1)]
+    
+    def _aspect_bucket(self, size):
+        """返回与图像宽高比最接近的标准宽高比"""
+        ratio = math.log(size[0] / size[1])
+        return min(self.ASPECT_BUCKETS, key=lambda bucket: abs(math.log(bucket[0] / bucket[1]) - ratio))
+    
+    def _group_buckets(self, entries, bucket_mode, options, workers, on_error):
+        """
+        只读取图像头，将文件按分辨率或宽高比分组（桶的顺序为首次出现的顺序，桶内保持文件顺序）
+        
+        Returns:
+            [(桶名称, 桶尺寸 (宽, 高), 文件列表), ...]，aspect 分桶的桶尺寸为桶内最常见的尺寸
+        """
+        # 分片成员只顺序读取每个成员开头的数据用于解析图像头
+        payloads = self._read_payloads(entries, options, limit=self.HEADER_READ_BYTES)
+        probe_results = self._run_parallel(lambda entry: self._probe_file(entry, options, payloads), entries, workers)
+        groups = {}
+        for entry, (size, error) in zip(entries, probe_results):
+            if error is not None:
+                self._handle_error(entry, error, on_error)
+                continue
+            key = size if bucket_mode == "resolution" else self._aspect_bucket(size)
+            group = groups.setdefault(key, {"files": [], "sizes": {}})
+            group["files"].append(entry)
+            group["sizes"][size] = group["sizes"].get(size, 0) + 1
+        
+        buckets = []
+        for key, group in groups.items():
+            width, height = max(group["sizes"], key=group["sizes"].get)
+            if bucket_mode == "resolution":
+                label = f"{width}x{height}"
+            else:
+                label = f"{key[0]}:{key[1]} {width}x{height}"
+            buckets.append((label, (width, height), group["files"]))
+        return buckets
+    
+    def _split_buckets(self, buckets, max_images):
+        """将每个桶按 max_images 张拆分为多组 (0=不拆分)"""
+        if max_images <= 0:
+            return buckets
+        return [(label, size, files[start:start + max_images])
+                for label, size, files in buckets
+                for start in range(0, len(files), max_images)]
+    
+    def _bucket_options(self, bucket, options, bucket_fit):
+        """返回桶内文件和解码参数（固定批次尺寸，尺寸不同的图像按 bucket_fit 适配）"""
+        _, size, files = bucket
+        return files, dict(options, target_size=size, fit=bucket_fit)
+    
+    def _resolve_positions(self, file_count, load_order, load_interval, start_index, max_images, seed):
+        """将加载顺序、起始索引、加载间隔和最大数量解析为索引位置序列"""
+        # 根据加载顺序调整文件顺序
+        if load_order == "reverse":
+            positions = range(file_count - 1, -1, -1)
+        elif load_order == "random":
+            # 使用独立的随机数生成器按需生成排列（只生成实际读取的前缀，不修改全局 random 状态）
+            if seed > 0:
+                positions = seeded_permutation(file_count, seed)
+            else:
+                positions = random_permutation(file_count)
+            print(f"🎲 使用随机种子 {seed} 打乱文件顺序")
+        else:
+            positions = range(file_count)
+        
+        # 应用起始索引
+        if start_index > 0:
+            positions = positions[start_index:]
+        
+        # 应用加载间隔
+        if load_interval > 1:
+            positions = positions[::load_interval]
+        
+        # 应用最大数量限制
+        if max_images > 0:
+            positions = positions[:max_images]
+        
+        return positions
+    
+    def _resolve_workers(self, num_workers, file_count):
+        """确定解码线程数 (0=自动，即共享线程池大小，且不超过文件数)"""
+        return resolve_workers(num_workers, file_count)
+    
+    def _run_parallel(self, func, items, workers):
+        """按顺序对 items 执行 func，workers > 1 时使用 kktools 共享线程池"""
+        return run_parallel(func, items, workers)
+    
+    def _cache_key(self, entry, options):
+        """解码缓存键：文件 + 影响解码结果的参数（目录文件重新 stat，原地覆盖的文件不会命中旧帧）"""
+        return make_cache_key(refresh_entry(entry), (options["mode"], options["max_side"], options["exif"]))
+    
+    def _header_key(self, entry):
+        """图像头缓存键（目录文件重新 stat）"""
+        return make_header_key(refresh_entry(entry))
+    
+    def _target_size(self, size, max_side):
+        """根据 max_side 计算解码后的尺寸（只缩小，保持宽高比）"""
+        width, height = size
+        if max_side <= 0 or max(width, height) <= max_side:
+            return size
+        scale = max_side / max(width, height)
+        return (max(1, round(width * scale)), max(1, round(height * scale)))
+    
+    # 分片成员解析图像头时读取的字节数
+    HEADER_READ_BYTES = 256 * 1024
+    
+    def _read_payloads(self, entries, options, limit=None):
+        """在当前线程中按分片偏移顺序读取尚未缓存的分片成员数据，目录文件返回空字典"""
+        members = [entry for entry in entries if entry.archive is not None]
+        if options["cache_mode"] != "off":
+            use_disk = options["cache_mode"] == "memory+disk"
+            members = [entry for entry in members
+                       if get_cached_frame(self._cache_key(entry, options), use_disk) is None]
+        if limit is not None:
+            members = [entry for entry in members if HEADER_CACHE.get(self._header_key(entry)) is None]
+        if not members:
+            return {}
+        return read_archive_members(members, limit)
+    
+    def _open_image(self, entry, payloads=None):
+        """打开图像：目录文件直接打开，分片成员从已读取的数据打开（未读取时单独读取）"""
+        if entry.archive is None:
+            return Image.open(entry.path)
+        data = payloads.get(entry.path) if payloads else None
+        if data is None:
+            data = read_archive_members([entry])[entry.path]
+        return Image.open(io.BytesIO(data))
+    
+    # EXIF 方向 -> 校正用的变换（与 ImageOps.exif_transpose 一致），5-8 会交换宽高
+    EXIF_TRANSPOSE = {
+        2: Image.Transpose.FLIP_LEFT_RIGHT,
+        3: Image.Transpose.ROTATE_180,
+        4: Image.Transpose.FLIP_TOP_BOTTOM,
+        5: Image.Transpose.TRANSPOSE,
+        6: Image.Transpose.ROTATE_270,
+        7: Image.Transpose.TRANSVERSE,
+        8: Image.Transpose.ROTATE_90,
+    }
+    
+    def _exif_orientation(self, image):
+        """读取 EXIF 方向，只使用打开文件时已解析的信息（PNG 没有前置 eXIf 块时不读取，避免触发像素解码）"""
+        if image.format == "PNG" and "exif" not in image.info:
+            return 1
+        try:
+            return image.getexif().get(0x0112, 1)
+        except Exception:
+            return 1
+    
+    def _oriented_size(self, size, header, options):
+        """按 EXIF 方向校正尺寸"""
+        if options["exif"] and header.get("orientation", 1) in (5, 6, 7, 8):
+            return (size[1], size[0])
+        return size
+    
+    def _read_header(self, entry, payloads=None):
+        """读取图像头（尺寸、模式、EXIF 方向），结果按文件缓存，不解码像素"""
+        key = self._header_key(entry)
+        header = HEADER_CACHE.get(key)
+        if header is None:
+            try:
+                image = self._open_image(entry, payloads)
+            except Exception:
+                if entry.archive is None or not payloads:
+                    raise
+                # 只读取了成员开头的数据时图像头可能不完整，改为读取整个成员
+                image = self._open_image(entry)
+            with image:
+                header = {"size": image.size, "mode": image.mode, "orientation": self._exif_orientation(image)}
+            HEADER_CACHE.put(key, header)
+        return header
+    
+    def _probe_file(self, entry, options, payloads=None):
+        """只读取图像头获取解码后的尺寸（缓存命中时直接使用缓存帧的尺寸），返回 ((宽, 高), None) 或 (None, 错误)，不抛出异常"""
+        try:
+            if options["cache_mode"] != "off":
+                frame = get_cached_frame(self._cache_key(entry, options), options["cache_mode"] == "memory+disk")
+                if frame is not None:
+                    return (frame.shape[1], frame.shape[0]), None
+            header = self._read_header(entry, payloads)
+            return self._oriented_size(self._target_size(header["size"], options["max_side"]), header, options), None
+        except Exception as e:
+            return None, e
+    
+    def _open_reduced(self, image, target_size, mode):
+        """
+        以接近目标尺寸的 2 的幂缩放解码：JPEG 使用 draft 模式（DCT 域缩小），其他格式使用 Image.reduce，
+        最后再精确缩放到目标尺寸
+        """
+        if image.format == "JPEG":
+            # draft 选择不小于目标尺寸的最大缩小比例 (1/2, 1/4, 1/8)
+            image.draft("RGB", target_size)
+        if image.mode not in ("RGB", "RGBA", "L"):
+            # 调色板、16 位等模式先转换，reduce/resize 才能使用插值
+            image = image.convert(mode)
+        factor = 1
+        while image.width // (factor * 2) >= target_size[0] and image.height // (factor * 2) >= target_size[1]:
+            factor *= 2
+        if factor > 1:
+            image = image.reduce(factor)
+        if image.size != target_size:
+            image = image.resize(target_size, Image.Resampling.LANCZOS)
+        return image
+    
+    def _decode_frame(self, entry, options, payloads=None):
+        """解码单个图像文件为 uint8 数组，启用缓存时优先复用已解码的帧"""
+        use_cache = options["cache_mode"] != "off"
+        use_disk = options["cache_mode"] == "memory+disk"
+        if use_cache:
+            key = self._cache_key(entry, options)
+            frame = get_cached_frame(key, use_disk)
+            if frame is not None:
+                return frame
+        
+        with self._open_image(entry, payloads) as image:
+            orientation = self._exif_orientation(image) if options["exif"] else 1
+            target_size = self._target_size(image.size, options["max_side"])
+            if target_size != image.size:
+                image = self._open_reduced(image, target_size, options["mode"])
+            if image.mode != options["mode"]:
+                image = image.convert(options["mode"])
+            # 缩小之后再做方向校正，变换的像素更少
+            if orientation in self.EXIF_TRANSPOSE:
+                image = image.transpose(self.EXIF_TRANSPOSE[orientation])
+            frame = np.asarray(image)
+        
+        if use_cache:
+            put_cached_frame(key, frame, use_disk)
+        return frame
+    
+    def _fit_frame(self, frame, width, height, fit):
+        """
+        将尺寸不同的帧适配到批次尺寸：pad=等比缩放后居中，resize=直接缩放
+        
+        Returns:
+            (适配后的 uint8 帧, pad 时图像所在区域 (left, top, 宽, 高) 或 None)
+        """
+        image = Image.fromarray(np.ascontiguousarray(frame))
+        if fit == "resize":
+            return np.asarray(image.resize((width, height), Image.Resampling.LANCZOS)), None
+        scale = min(width / image.width, height / image.height)
+        new_w = max(1, min(width, round(image.width * scale)))
+        new_h = max(1, min(height, round(image.height * scale)))
+        left, top = (width - new_w) // 2, (height - new_h) // 2
+        # 填充区域为 0（RGBA 时透明度也为 0）
+        canvas = np.zeros((height, width, frame.shape[2]), dtype=np.uint8)
+        canvas[top:top + new_h, left:left + new_w] = np.asarray(image.resize((new_w, new_h), Image.Resampling.LANCZOS))
+        return canvas, (left, top, new_w, new_h)
+    
+    def _decode_into(self, out_np, index, entry, options, mask_np=None, payloads=None):
+        """
+        解码单个图像文件并直接写入预分配输出的第 index 帧（uint8 -> float32 在写入时转换），返回错误或 None
+        
+        蒙版按 0-255 写入，与图像一起整批归一化：RGBA 帧写入透明通道，pad 适配的 RGB 帧只标记图像区域
+        """
+        try:
+            frame = self._decode_frame(entry, options, payloads)
+            region = None
+            if frame.shape[:2] != out_np.shape[1:3]:
+                if not options.get("fit"):
+                    raise ValueError(f"解码尺寸 {frame.shape[1]}x{frame.shape[0]} 与批次尺寸不一致")
+                frame, region = self._fit_frame(frame, out_np.shape[2], out_np.shape[1], options["fit"])
+            out_np[index] = frame[..., :3]
+            if mask_np is not None:
+                if frame.shape[2] == 4:
+                    mask_np[index] = frame[..., 3]
+                elif region is not None:
+                    left, top, new_w, new_h = region
+                    mask_np[index].fill(0)
+                    mask_np[index, top:top + new_h, left:left + new_w] = 255.0
+                else:
+                    mask_np[index].fill(255.0)
+            return None
+        except Exception as e:
+            return e
+    
+    def _filter_entries(self, entries, filters, options, workers, on_error):
+        """
+        解码之前筛选文件：先按目录扫描索引中的文件大小（不 stat、不打开文件），再按图像头的尺寸、宽高比和颜色模式
+        
+        Returns:
+            (保留的文件列表, 排除的文件列表)，保持文件顺序
+        """
+        kept = []
+        rejected = []
+        min_bytes = filters["min_file_kb"] * 1024
+        max_bytes = filters["max_file_kb"] * 1024
+        for entry in entries:
+            if entry.size < min_bytes or (max_bytes and entry.size > max_bytes):
+                rejected.append(entry)
+                continue
+            kept.append(entry)
+        
+        header_filters = ("min_width", "max_width", "min_height", "max_height", "min_aspect", "max_aspect")
+        if not kept or (filters["image_mode"] == "any" and not any(filters[name] for name in header_filters)):
+            return kept, rejected
+        
+        def probe_header(entry):
+            try:
+                return self._read_header(entry, payloads), None
+            except Exception as e:
+                return None, e
+        
+        payloads = self._read_payloads(kept, options, limit=self.HEADER_READ_BYTES)
+        headers = self._run_parallel(probe_header, kept, workers)
+        entries, kept = kept, []
+        for entry, (header, error) in zip(entries, headers):
+            if error is not None:
+                self._handle_error(entry, error, on_error)
+                rejected.append(entry)
+                continue
+            width, height = self._oriented_size(header["size"], header, options)
+            aspect = width / height
+            if ((filters["min_width"] and width < filters["min_width"])
+                    or (filters["max_width"] and width > filters["max_width"])
+                    or (filters["min_height"] and height < filters["min_height"])
+                    or (filters["max_height"] and height > filters["max_height"])
+                    or (filters["min_aspect"] and aspect < filters["min_aspect"])
+                    or (filters["max_aspect"] and aspect > filters["max_aspect"])
+                    or (filters["image_mode"] != "any" and header["mode"] != filters["image_mode"])):
+                rejected.append(entry)
+            else:
+                kept.append(entry)
+        return kept, rejected
+    
+    def _describe_sizes(self, entries, options):
+        """按出现次数汇总解码尺寸（最多列出 3 种）"""
+        counts = {}
+        for entry in entries:
+            size, _ = self._probe_file(entry, options)
+            if size is not None:
+                counts[size] = counts.get(size, 0) + 1
+        ordered = sorted(counts.items(), key=lambda item: -item[1])
+        parts = [f"{w}x{h}×{count}" for (w, h), count in ordered[:3]]
+        if len(ordered) > 3:
+            parts.append("...")
+        return ", ".join(parts)
+    
+    def _handle_error(self, entry, error, on_error):
+        """单个文件失败：stop 时中止整批，skip 时记录日志"""
+        if on_error == "stop":
+            raise RuntimeError(f"加载图像失败 {entry.path}: {error}")
+        print(f"⚠️ 加载图像失败 {entry.path}: {error}")
+    
+    def _load_batch(self, image_files, workers, on_error, options):
+        """
+        读取图像头确定批次尺寸，预分配输出张量后并行解码写入，最后整批一次归一化
+        
+        Returns:
+            (图像张量 或 None, 蒙版张量 (B, H, W) 或 None (全为 1), 成功加载的文件名列表)
+        """
+        # 0. 分片成员：在当前线程按偏移顺序一次读取原始数据，解析和解码仍在线程池中进行
+        payloads = self._read_payloads(image_files, options)
+        
+        # 1. 只读取图像头
+        probed = []
+        probe_results = self._run_parallel(lambda entry: self._probe_file(entry, options, payloads), image_files, workers)
+        for entry, (size, error) in zip(image_files, probe_results):
+            if error is not None:
+                self._handle_error(entry, error, on_error)
+                continue
+            probed.append((entry, size))
+        
+        if not probed:
+            return None, None, []
+        
+        # 2. 所有图像尺寸必须一致才能组成一个批次（分桶时使用桶尺寸，不一致的图像解码后适配）；
+        #    与第一张尺寸不同的图像按单个文件失败处理：skip 时跳过（游标照常前进），stop 时整批失败
+        if options.get("target_size") is not None:
+            width, height = options["target_size"]
+        else:
+            width, height = probed[0][1]
+            matched = []
+            for entry, size in probed:
+                if size != (width, height):
+                    self._handle_error(entry, ValueError(f"图像尺寸 {size[0]}x{size[1]} 与批次尺寸 {width}x{height} 不一致"
+                                                         f"（可使用 bucket_mode 按尺寸分组加载）"), on_error)
+                    continue
+                matched.append((entry, size))
+            probed = matched
+        
+        # 3. 预分配整批输出，各线程解码后写入各自的帧；只有需要填充时才分配蒙版
+        images_tensor = torch.empty((len(probed), height, width, 3), dtype=torch.float32)
+        out_np = images_tensor.numpy()
+        masks_tensor = None
+        mask_np = None
+        if options["mode"] == "RGBA" or (options.get("fit") == "pad" and any(size != (width, height) for _, size in probed)):
+            masks_tensor = torch.empty((len(probed), height, width), dtype=torch.float32)
+            mask_np = masks_tensor.numpy()
+        errors = self._run_parallel(lambda item: self._decode_into(out_np, item[0], item[1][0], options, mask_np, payloads),
+                                    list(enumerate(probed)), workers)
+        
+        # 4. 跳过失败的帧：原地前移成功的帧，避免整批复制
+        loaded_files = []
+        for index, ((entry, size), error) in enumerate(zip(probed, errors)):
+            if error is not None:
+                self._handle_error(entry, error, on_error)
+                continue
+            if len(loaded_files) != index:
+                images_tensor[len(loaded_files)] = images_tensor[index]
+                if masks_tensor is not None:
+                    masks_tensor[len(loaded_files)] = masks_tensor[index]
+            loaded_files.append(entry.name)
+            print(f"✅ 加载图像: {entry.name} - 尺寸: {size}")
+        
+        if not loaded_files:
+            return None, None, []
+        
+        # 5. 整批一次归一化
+        images_tensor = images_tensor[:len(loaded_files)]
+        images_tensor.div_(255.0)
+        if masks_tensor is not None:
+            masks_tensor = masks_tensor[:len(loaded_files)]
+            masks_tensor.div_(255.0)
+        return images_tensor, masks_tensor, loaded_files
+    
+    def _first_size_files(self, image_files, options, workers):
+        """
+        只保留与第一个可读取文件尺寸相同的文件（只读取图像头），读取失败的文件保留，由 on_error 处理
+        
+        Returns:
+            保留的文件列表，保持文件顺序
+        """
+        payloads = self._read_payloads(image_files, options, limit=self.HEADER_READ_BYTES)
+        probes = self._run_parallel(lambda entry: self._probe_file(entry, options, payloads), image_files, workers)
+        sizes = [size for size, error in probes if error is None]
+        if not sizes:
+            return image_files
+        kept = [entry for entry, (size, error) in zip(image_files, probes) if error is not None or size == sizes[0]]
+        if len(kept) < len(image_files):
+            print(f"👀 监视模式: {len(image_files) - len(kept)} 个尺寸不同的新文件留到下一次执行")
+        return kept
+    
+    def _load_sidecars(self, directory, entries, caption_extension, load_metadata, workers):
+        """
+        从目录（或分片）扫描索引中查找与图像同名的字幕和 .json 元数据并读取，不再单独遍历目录
+        
+        Returns:
+            (字幕列表, 元数据 JSON 字符串列表)，与 entries 一一对应，缺失时为 "" / "{}"
+        """
+        captions = [""] * len(entries)
+        metadata = ["{}"] * len(entries)
+        wanted = set()
+        if caption_extension != "off":
+            wanted.add(caption_extension)
+        if load_metadata:
+            wanted.add("json")
+        if not wanted or not entries:
+            return captions, metadata
+        
+        all_entries = scan_archive(directory) if is_archive(directory) else scan_directory(directory)
+        sidecars = {(os.path.splitext(entry.name)[0], entry.ext): entry for entry in all_entries if entry.ext in wanted}
+        jobs = []
+        for index, entry in enumerate(entries):
+            stem = os.path.splitext(entry.name)[0]
+            for ext in wanted:
+                sidecar = sidecars.get((stem, ext))
+                if sidecar is not None:
+                    jobs.append((index, sidecar))
+        if not jobs:
+            return captions, metadata
+        
+        # 分片成员按偏移顺序一次读取，目录文件并行读取
+        if entries[0].archive is not None:
+            payloads = read_archive_members([sidecar for _, sidecar in jobs])
+            texts = [payloads[sidecar.path].decode("utf-8", errors="replace") for _, sidecar in jobs]
+        else:
+            def read_text(sidecar):
+                with open(sidecar.path, 'r', encoding='utf-8', errors='replace') as f:
+                    return f.read()
+            texts = self._run_parallel(read_text, [sidecar for _, sidecar in jobs], workers)
+        
+        for (index, sidecar), text in zip(jobs, texts):
+            if sidecar.ext == "json":
+                try:
+                    metadata[index] = json.dumps(json.loads(text), ensure_ascii=False)
+                except ValueError as e:
+                    print(f"⚠️ 元数据文件格式错误 {sidecar.path}: {e}")
+            else:
+                captions[index] = text.strip()
+        print(f"📝 读取同名字幕/元数据: {len(jobs)} 个文件")
+        return captions, metadata
     
     def _get_supported_extensions(self, file_extensions):
         """获取支持的图像文件扩展名列表"""
@@ -1009,6 +1766,281 @@ class BatchImageLoader:
         return " | ".join(info_parts)
 
 
+class BatchImageSaver:
+    """批量图像保存节点 - 在后台线程池中编码并原子写入，图节点在交出批次后立即返回"""
+    
+    # 后台编码线程数和最多排队的图像数（超过时等待，限制内存占用）
+    SAVE_WORKERS = int(os.environ.get("KKTOOLS_SAVE_WORKERS", str(min(4, os.cpu_count() or 1))))
+    SAVE_MAX_PENDING = int(os.environ.get("KKTOOLS_SAVE_MAX_PENDING", "64"))
+    
+    # 允许 output_dir 使用 output 目录之外的路径（服务器端开关，工作流本身无法开启）
+    ALLOW_OUTSIDE_OUTPUT = os.environ.get("KKTOOLS_SAVE_ALLOW_OUTSIDE_OUTPUT", "0").strip().lower() in ("1", "true", "yes", "on")
+    
+    _executor_lock = threading.Lock()
+    _executor = None
+    _pending_slots = threading.BoundedSemaphore(SAVE_MAX_PENDING)
+    
+    # 已提交但尚未写入完成的路径（后台写入之前磁盘上还没有文件，避免同名文件互相覆盖）
+    _reserved_lock = threading.Lock()
+    _reserved_paths = set()
+    
+    # 后台写入失败的 (路径, 错误)，在下一次执行时报告（只保留最近的记录）
+    _failed_saves = deque(maxlen=256)
+    
+    FORMAT_EXTENSIONS = {"png": ".png", "jpg": ".jpg", "webp": ".webp"}
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "images": ("IMAGE",),
+                "output_dir": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "输出目录 (留空=ComfyUI output 目录，相对路径基于 output 目录)"
+                }),
+                "filename_template": ("STRING", {
+                    "default": "kktools_{prompt_hash}_{seed}_{index:05d}",
+                    "multiline": False,
+                    "tooltip": "文件名模板 (不含扩展名)，可用字段: {index} {seed} {prompt_hash}"
+                }),
+                "format": (["png", "jpg", "webp"], {
+                    "default": "png"
+                }),
+                "quality": ("INT", {
+                    "default": 95,
+                    "min": 1,
+                    "max": 100,
+                    "step": 1,
+                    "tooltip": "jpg/webp 质量"
+                }),
+                "compress_level": ("INT", {
+                    "default": 1,
+                    "min": 0,
+                    "max": 9,
+                    "step": 1,
+                    "tooltip": "png 压缩级别 (0=不压缩最快, 9=最小文件最慢)"
+                }),
+                "seed": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 0xffffffffffffffff,
+                    "step": 1
+                }),
+            },
+            "optional": {
+                "start_index": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 99999999,
+                    "step": 1,
+                    "tooltip": "{index} 的起始值"
+                }),
+                "embed_metadata": ("BOOLEAN", {
+                    "default": True,
+                    "tooltip": "png 中写入 prompt/workflow 信息"
+                }),
+                "wait_for_completion": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "等待本批图像写入完成后再返回；关闭时返回的路径在后台写入完成前不保证存在，写入失败在下一次执行时报告"
+                }),
+                "overwrite": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "文件名已存在时覆盖；关闭时在文件名后追加 _1、_2 等序号"
+                }),
+            },
+            "hidden": {
+                "prompt": "PROMPT",
+                "extra_pnginfo": "EXTRA_PNGINFO",
+            },
+        }
+    
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("file_paths",)
+    FUNCTION = "save_images"
+    OUTPUT_NODE = True
+    CATEGORY = "kktools/Image"
+    
+    def save_images(self, images, output_dir, filename_template, format, quality, compress_level, seed,
+                    start_index=0, embed_metadata=True, wait_for_completion=False, overwrite=False, prompt=None,
+                    extra_pnginfo=None):
+        """
+        批量保存图像
+        
+        Args:
+            images: 图像张量 (Batch, H, W, C)
+            output_dir: 输出目录
+            filename_template: 文件名模板 ({index} {seed} {prompt_hash})
+            format: 图像格式
+            quality: jpg/webp 质量
+            compress_level: png 压缩级别
+            seed: 写入文件名的种子
+            start_index: {index} 的起始值
+            embed_metadata: 是否在 png 中写入 prompt/workflow
+            wait_for_completion: 是否等待写入完成
+            overwrite: 是否覆盖同名文件 (否=追加序号)
+            
+        Returns:
+            (换行分隔的文件路径，之后附加写入失败的记录,)
+        """
+        try:
+            # 之前后台写入失败的文件（节点当时已经返回了这些路径）
+            failures = self._take_failures()
+            output_dir = self._resolve_output_dir(output_dir)
+            prompt_hash = self._prompt_hash(prompt)
+            extension = self.FORMAT_EXTENSIONS[format]
+            
+            # 在当前线程中整批量化为 uint8（之后上游张量可以被释放或修改），编码交给后台线程
+            batch_np = tensor_to_uint8(images)
+            if batch_np.shape[-1] == 1:
+                batch_np = batch_np[..., 0]
+            pnginfo = self._make_pnginfo(prompt, extra_pnginfo) if format == "png" and embed_metadata else None
+            
+            paths = []
+            futures = []
+            # 先校验整批文件名都位于输出目录之内，再提交任何一张
+            base_paths = [self._contained_path(output_dir, filename_template.format(index=start_index + i, seed=seed,
+                                                                                    prompt_hash=prompt_hash))
+                          for i in range(batch_np.shape[0])]
+            for i, base_path in enumerate(base_paths):
+                path = self._reserve_path(base_path, extension, overwrite)
+                paths.append(path)
+                futures.append(self._submit(batch_np[i], path, format, quality, compress_level, pnginfo))
+            
+            if wait_for_completion:
+                wait(futures)
+                batch_failures = self._take_failures()
+                failed_paths = {path for path, _ in batch_failures}
+                paths = [path for path in paths if path not in failed_paths]
+                failures.extend(batch_failures)
+                print(f"✅ 已保存 {len(paths)} 张图像到 {output_dir}")
+            else:
+                print(f"📤 已提交 {len(paths)} 张图像到后台保存: {output_dir}")
+            if failures:
+                print(f"⚠️ {len(failures)} 张图像保存失败")
+            return ("\n".join(paths + [f"保存失败: {path}: {error}" for path, error in failures]),)
+            
+        except Exception as e:
+            error_msg = f"批量保存图像时出错: {str(e)}"
+            print(f"BatchImageSaver Error: {error_msg}")
+            return (error_msg,)
+    
+    def _resolve_output_dir(self, output_dir):
+        """
+        解析输出目录：留空使用 ComfyUI output 目录，相对路径基于该目录；
+        与 ComfyUI SaveImage 一样，解析后的路径必须位于 output 目录之内（KKTOOLS_SAVE_ALLOW_OUTSIDE_OUTPUT=1 时不限制）
+        """
+        try:
+            import folder_paths
+            base_dir = folder_paths.get_output_directory()
+        except Exception:
+            base_dir = os.path.join(os.getcwd(), "output")
+        if not output_dir.strip():
+            output_dir = os.path.abspath(base_dir)
+        elif self.ALLOW_OUTSIDE_OUTPUT:
+            output_dir = os.path.abspath(os.path.join(base_dir, output_dir.strip()))
+        else:
+            output_dir = self._contained_path(os.path.abspath(base_dir), output_dir.strip())
+        os.makedirs(output_dir, exist_ok=True)
+        return output_dir
+    
+    def _contained_path(self, root, name):
+        """将 name 拼接到 root 之下，结果（绝对路径、.. 解析后）不在 root 之内时抛出 ValueError"""
+        path = os.path.abspath(os.path.join(root, name))
+        if os.path.commonpath([path, root]) != root:
+            raise ValueError(f"保存路径不在输出目录之内: {name}")
+        return path
+    
+    def _prompt_hash(self, prompt):
+        """prompt 内容的短摘要（同一工作流和参数得到同一个值）"""
+        if not prompt:
+            return "noprompt"
+        data = json.dumps(prompt, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()[:8]
+    
+    def _make_pnginfo(self, prompt, extra_pnginfo):
+        """与 ComfyUI 保存节点相同的 png 文本信息，每批只生成一次"""
+        if prompt is None and not extra_pnginfo:
+            return None
+        pnginfo = PngInfo()
+        if prompt is not None:
+            pnginfo.add_text("prompt", json.dumps(prompt))
+        for key, value in (extra_pnginfo or {}).items():
+            pnginfo.add_text(key, json.dumps(value))
+        return pnginfo
+    
+    def _reserve_path(self, base_path, extension, overwrite):
+        """
+        登记本次要写入的路径：不覆盖时，磁盘上已存在或正在后台写入的文件名追加 _1、_2 等序号
+        （同一工作流重复执行时文件名相同，默认不覆盖之前的批次）
+        """
+        cls = type(self)
+        with cls._reserved_lock:
+            path = base_path + extension
+            counter = 0
+            while path in cls._reserved_paths or (not overwrite and os.path.exists(path)):
+                counter += 1
+                path = f"{base_path}_{counter}{extension}"
+            cls._reserved_paths.add(path)
+            return path
+    
+    def _submit(self, frame, path, file_format, quality, compress_level, pnginfo):
+        """提交一张图像到后台编码线程池，排队数量达到上限时等待"""
+        cls = type(self)
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=max(1, cls.SAVE_WORKERS), thread_name_prefix="kktools-save")
+        cls._pending_slots.acquire()
+        try:
+            return cls._executor.submit(self._write_image, frame, path, file_format, quality, compress_level, pnginfo)
+        except Exception:
+            cls._pending_slots.release()
+            with cls._reserved_lock:
+                cls._reserved_paths.discard(path)
+            raise
+    
+    def _take_failures(self):
+        """取出并清空后台写入失败的记录"""
+        cls = type(self)
+        with cls._reserved_lock:
+            failures = list(cls._failed_saves)
+            cls._failed_saves.clear()
+        return failures
+    
+    def _write_image(self, frame, path, file_format, quality, compress_level, pnginfo):
+        """编码并原子写入（先写同目录临时文件再替换），失败时记录，由下一次执行报告"""
+        directory, file_name = os.path.split(path)
+        tmp_path = os.path.join(directory, f".{file_name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            image = Image.fromarray(frame)
+            if file_format == "jpg" and image.mode in ("RGBA", "LA"):
+                # JPEG 不支持透明通道（例如 PadImageToCanvas 的透明背景输出），丢弃透明通道后保存
+                image = image.convert("RGB" if image.mode == "RGBA" else "L")
+            with open(tmp_path, "wb") as f:
+                if file_format == "png":
+                    image.save(f, format="PNG", compress_level=compress_level, pnginfo=pnginfo)
+                elif file_format == "jpg":
+                    image.save(f, format="JPEG", quality=quality)
+                else:
+                    image.save(f, format="WEBP", quality=quality)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"❌ 保存图像失败 {path}: {e}")
+            with type(self)._reserved_lock:
+                type(self)._failed_saves.append((path, str(e)))
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        finally:
+            cls = type(self)
+            with cls._reserved_lock:
+                cls._reserved_paths.discard(path)
+            cls._pending_slots.release()
+
+
 # ComfyUI 节点注册
 NODE_CLASS_MAPPINGS = {
     "PadImageToCanvas": PadImageToCanvas,
@@ -1016,6 +2048,7 @@ NODE_CLASS_MAPPINGS = {
     "Resize": Resize,
     "GetImage": GetImage,
     "BatchImageLoader": BatchImageLoader,
+    "BatchImageSaver": BatchImageSaver,
 }
 
 # 节点在菜单中显示的名称
@@ -1025,6 +2058,7 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "Resize": "Resize (图像蒙版同步调整)",
     "GetImage": "Get Image (获取图像尺寸)",
     "BatchImageLoader": "Batch Image Loader (批量图像加载)",
+    "BatchImageSaver": "Batch Image Saver (批量图像保存)",
 }
 
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
\ No newline at end of file